@@ -0,0 +1,57 @@
+import io
+from fractions import Fraction
+import av
+import numpy as np
+from config.settings import VOICE_SAMPLE_RATE, VOICE_BITRATE
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SAMPLES = VOICE_SAMPLE_RATE  # feed encoder one second at a time
+
+class OpusEncoder:
+    """Incremental Opus-in-OGG encoder: feed float PCM chunks, get voice note bytes"""
+
+    def __init__(self, sample_rate: int = VOICE_SAMPLE_RATE, bitrate: int = VOICE_BITRATE):
+        self.sample_rate = sample_rate
+        self.samples = 0
+        self._output = io.BytesIO()
+        self._container = av.open(self._output, mode="w", format="ogg")
+        self._stream = self._container.add_stream("libopus", rate=sample_rate)
+        self._stream.bit_rate = bitrate
+        self._stream.layout = "mono"
+
+    def feed(self, audio):
+        """Encode mono float waveform (torch tensor or numpy array), chunk by chunk"""
+        audio = audio.reshape(-1)
+        for start in range(0, audio.shape[0], CHUNK_SAMPLES):
+            chunk = audio[start:start + CHUNK_SAMPLES]
+            if hasattr(chunk, "numpy"):
+                chunk = chunk.detach().cpu().numpy()
+            chunk = np.ascontiguousarray(chunk, dtype=np.float32).reshape(1, -1)
+
+            frame = av.AudioFrame.from_ndarray(chunk, format="flt", layout="mono")
+            frame.sample_rate = self.sample_rate
+            frame.time_base = Fraction(1, self.sample_rate)
+            frame.pts = self.samples
+            self.samples += chunk.shape[1]
+
+            for packet in self._stream.encode(frame):
+                self._container.mux(packet)
+
+    @property
+    def duration(self) -> float:
+        return self.samples / self.sample_rate
+
+    def finish(self) -> bytes:
+        """Flush encoder and return OGG/Opus bytes"""
+        for packet in self._stream.encode(None):
+            self._container.mux(packet)
+        self._container.close()
+        return self._output.getvalue()
+
+def encode_ogg_opus(audio, sample_rate: int = VOICE_SAMPLE_RATE, bitrate: int = VOICE_BITRATE) -> bytes:
+    """Encode whole waveform to OGG/Opus"""
+    encoder = OpusEncoder(sample_rate, bitrate)
+    encoder.feed(audio)
+    return encoder.finish()
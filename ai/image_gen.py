@@ -1,88 +1,176 @@
 import httpx
+import hashlib
 import json
 import os
 import asyncio
-import uuid
+from typing import Optional
 from utils.cache import Cache, get_prompt_hash
-from utils.watermark import add_watermark, image_to_bytes
-from config.settings import IMAGE_TIMEOUT, OPENROUTER_API_KEY
+from utils.watermark import watermark_engine
+from utils.singleflight import SingleFlight
+from config.settings import (
+    IMAGE_TIMEOUT, OPENROUTER_API_KEY, IMAGE_CONNECT_TIMEOUT, IMAGE_DOWNLOAD_TIMEOUT,
+    IMAGE_API_MAX_CONNECTIONS, IMAGE_CDN_MAX_CONNECTIONS, IMAGE_KEEPALIVE_EXPIRY, WATERMARK_TRIAL_TEXT,
+    JPEG_QUALITY
+)
+from ai.limiter import limiters, priority_for, PRIORITY_VIP, QueueTimeout, UpstreamError
 import logging
-from PIL import Image
-import io
 
 logger = logging.getLogger(__name__)
 
-async def generate_image_async(prompt: str, character_lora: str, cache: Cache = None, is_vip: bool = False, user=None) -> str:
-    """Generate image via OpenRouter API"""
+class ImageService:
+    """Long-lived HTTP/2 clients for OpenRouter image generation and result downloads"""
+
+    def __init__(self):
+        self._api: Optional[httpx.AsyncClient] = None
+        self._cdn: Optional[httpx.AsyncClient] = None
+
+    async def start(self):
+        """Open keep-alive clients with separate pools for API and CDN"""
+        if self._api is not None:
+            return
+        self._api = httpx.AsyncClient(
+            base_url="https://openrouter.ai/api/v1",
+            http2=True,
+            headers={
+                "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+                "Content-Type": "application/json"
+            },
+            timeout=httpx.Timeout(IMAGE_TIMEOUT, connect=IMAGE_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=IMAGE_API_MAX_CONNECTIONS,
+                max_keepalive_connections=IMAGE_API_MAX_CONNECTIONS,
+                keepalive_expiry=IMAGE_KEEPALIVE_EXPIRY
+            )
+        )
+        self._cdn = httpx.AsyncClient(
+            http2=True,
+            follow_redirects=True,
+            timeout=httpx.Timeout(IMAGE_DOWNLOAD_TIMEOUT, connect=IMAGE_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=IMAGE_CDN_MAX_CONNECTIONS,
+                max_keepalive_connections=IMAGE_CDN_MAX_CONNECTIONS,
+                keepalive_expiry=IMAGE_KEEPALIVE_EXPIRY
+            )
+        )
+        logger.info("Image service started")
+
+    async def close(self):
+        """Close clients and their pooled connections"""
+        for client in (self._api, self._cdn):
+            if client is not None:
+                await client.aclose()
+        self._api = self._cdn = None
+        logger.info("Image service closed")
+
+    async def generate(self, full_prompt: str) -> str:
+        """Request generation, returns result URL"""
+        await self.start()
+        response = await self._api.post(
+            "/images/generations",
+            json={
+                "model": "black-forest-labs/flux-dev",
+                "prompt": full_prompt,
+                "n": 1,
+                "size": "1024x1024"
+            }
+        )
+        if response.status_code != 200:
+            raise UpstreamError(f"OpenRouter API error: {response.status_code} - {response.text}")
+        return response.json()["data"][0]["url"]
+
+    async def download(self, url: str) -> bytes:
+        """Download generated image"""
+        await self.start()
+        response = await self._cdn.get(url)
+        if response.status_code != 200:
+            raise UpstreamError(f"Failed to download image: {response.status_code}")
+        return response.content
+
+image_service = ImageService()
+
+# Identical prompts in flight share one paid generation
+image_flights = SingleFlight("image")
+variant_flights = SingleFlight("image_variant")
+
+_key_stats = {kind: {"hits": 0, "misses": 0} for kind in ("canonical", "raw")}
+
+async def generate_clean(prompt: str, character_lora: str, priority: int) -> bytes:
+    """Generate unwatermarked image bytes, raises on upstream failure"""
+    # Prepare prompt
+    full_prompt = f"Russian girl 19 y.o., {prompt}, realistic, 4k, nsfw"
+
+    async with limiters["image"].slot(priority):
+        image_url = await image_service.generate(full_prompt)
+        return await image_service.download(image_url)
+
+def variant_spec(watermark: Optional[str] = None, max_side: Optional[int] = None, quality: int = None) -> str:
+    """Cache key part describing how a variant is derived from its master"""
+    mark = hashlib.md5(watermark.encode()).hexdigest()[:8] if watermark else "none"
+    return f"wm={mark};side={max_side or 0};q={quality or JPEG_QUALITY}"
+
+async def render_variant(master: bytes, cache: Cache = None, watermark: Optional[str] = None,
+                         max_side: Optional[int] = None, quality: int = None) -> bytes:
+    """Variant of master image, derived once and cached by (master hash, spec); master itself if nothing changes"""
+    if not watermark and not max_side and quality is None:
+        # Re-encoding would only lose quality and store a second copy of the master
+        return master
+    quality = quality or JPEG_QUALITY
+    spec = variant_spec(watermark, max_side, quality)
+    master_hash = hashlib.sha256(master).hexdigest()
+    if cache:
+        cached = await cache.get_image_variant(master_hash, spec)
+        if cached:
+            return cached
+
+    async def derive() -> bytes:
+        variant = await watermark_engine.process(master, watermark, max_side, quality)
+        if cache:
+            await cache.set_image_variant(master_hash, spec, variant)
+        return variant
+
+    return await variant_flights.do((master_hash, spec), derive)
+
+async def finish_image(master: bytes, is_vip: bool = False, user=None, cache: Cache = None) -> bytes:
+    """Image for user: clean master for VIP, watermarked JPEG once trial ended"""
+    watermark = WATERMARK_TRIAL_TEXT if not is_vip and user and user.trial_ended else None
+    return await render_variant(master, cache, watermark)
+
+async def _generate_master(prompt: str, character_lora: str, priority: int, cache: Cache, prompt_hash: str) -> bytes:
+    master = await generate_clean(prompt, character_lora, priority)
+    # Cache the clean master before the flight ends so late callers hit it
+    if cache:
+        await cache.set_image_cache(0, prompt_hash, master)
+    return master
+
+def image_cache_stats() -> dict:
+    """Master cache hit rate by key kind (canonical tag set vs raw prompt)"""
+    return {
+        kind: {**counts, "hit_rate": round(counts["hits"] / max(1, counts["hits"] + counts["misses"]), 3)}
+        for kind, counts in _key_stats.items()
+    }
+
+async def generate_image_async(prompt: str, character_lora: str, cache: Cache = None, is_vip: bool = False, user=None,
+                               cache_key: str = None) -> Optional[bytes]:
+    """Generate image via OpenRouter API, returns JPEG bytes"""
     try:
-        # Check cache first
+        # Clean master is shared by every user tier; canonical keys ignore prompt wording
+        prompt_hash = get_prompt_hash(cache_key or prompt, character_lora)
+        master = await cache.get_image_cache(0, prompt_hash) if cache else None  # Global cache
         if cache:
-            prompt_hash = get_prompt_hash(prompt, character_lora)
-            cached = await cache.get_image_cache(0, prompt_hash)  # Global cache
-            if cached:
-                logger.info("Using cached image")
-                # Save cached image to temp file
-                temp_filename = f"temp/photo_{uuid.uuid4()}.jpg"
-                os.makedirs("temp", exist_ok=True)
-                with open(temp_filename, "wb") as f:
-                    f.write(cached)
-                return temp_filename
-
-        # Prepare prompt
-        full_prompt = f"Russian girl 19 y.o., {prompt}, realistic, 4k, nsfw"
-
-        async with httpx.AsyncClient(timeout=IMAGE_TIMEOUT) as client:
-            response = await client.post(
-                "https://openrouter.ai/api/v1/images/generations",
-                headers={
-                    "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": "black-forest-labs/flux-dev",
-                    "prompt": full_prompt,
-                    "n": 1,
-                    "size": "1024x1024"
-                }
+            _key_stats["canonical" if cache_key else "raw"]["hits" if master else "misses"] += 1
+        if master:
+            logger.info("Using cached master image")
+        else:
+            priority = PRIORITY_VIP if is_vip else priority_for(user)
+            master = await image_flights.do(
+                prompt_hash, lambda: _generate_master(prompt, character_lora, priority, cache, prompt_hash)
             )
 
-            if response.status_code != 200:
-                logger.error(f"OpenRouter API error: {response.status_code} - {response.text}")
-                return None
-
-            data = response.json()
-            image_url = data["data"][0]["url"]
-
-            # Download image
-            image_response = await client.get(image_url)
-            if image_response.status_code != 200:
-                logger.error(f"Failed to download image: {image_response.status_code}")
-                return None
-
-            image_bytes = image_response.content
-
-            # Process image
-            image = Image.open(io.BytesIO(image_bytes))
-
-            # Add watermark if not VIP and trial ended
-            if not is_vip and user and user.trial_ended:
-                image = add_watermark(image, "DreamGF.ru — VIP 990₽")
-
-            # Convert to bytes
-            image_bytes = image_to_bytes(image)
-
-            # Save to temp file
-            temp_filename = f"temp/photo_{uuid.uuid4()}.jpg"
-            os.makedirs("temp", exist_ok=True)
-            with open(temp_filename, "wb") as f:
-                f.write(image_bytes)
-
-            # Cache the result
-            if cache and image_bytes:
-                await cache.set_image_cache(0, prompt_hash, image_bytes)
-
-            return temp_filename
+        return await finish_image(master, is_vip, user, cache)
 
+    except (UpstreamError, QueueTimeout) as e:
+        logger.error(f"Image API error: {e}")
+        return None
     except Exception as e:
         logger.error(f"Image generation failed: {e}")
         return None
@@ -0,0 +1,158 @@
+import asyncio
+import os
+import time
+import uuid
+from collections import defaultdict, deque
+from typing import Optional
+from ai.image_gen import generate_clean
+from ai.limiter import limiters, PRIORITY_BACKGROUND, QueueTimeout, UpstreamError
+from ai.scenes import DEFAULT_SCENE, scene_prompt
+from utils.characters import load_character, list_characters
+from config.settings import (
+    INVENTORY_DIR, INVENTORY_LOW_WATER, INVENTORY_HIGH_WATER, INVENTORY_REFILL_INTERVAL, INVENTORY_IDLE_ACTIVE
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _take_file(path: str) -> bytes:
+    """Read stocked image and remove it so it is served once"""
+    with open(path, "rb") as f:
+        data = f.read()
+    os.remove(path)
+    return data
+
+class ImageInventory:
+    """Pregenerated unwatermarked images per (character, scene) on disk, refilled when idle"""
+
+    def __init__(self, root: str = INVENTORY_DIR, low_water: int = INVENTORY_LOW_WATER,
+                 high_water: int = INVENTORY_HIGH_WATER):
+        self.root = root
+        self.low_water = low_water
+        self.high_water = max(high_water, low_water)
+        self._stock = defaultdict(deque)  # (character, scene) -> file paths, oldest first
+        self._wanted = set()  # slots kept stocked: defaults plus anything requested
+        self._low_since = {}  # slots being refilled -> when they fell below low water
+        self.hits = 0
+        self.misses = 0
+        self.refills = 0
+        self.refill_errors = 0
+        self.refill_lags = deque(maxlen=100)
+
+    def _scan(self) -> dict:
+        stock = {}
+        if not os.path.isdir(self.root):
+            return stock
+        for character in os.listdir(self.root):
+            for scene in os.listdir(os.path.join(self.root, character)):
+                folder = os.path.join(self.root, character, scene)
+                files = [os.path.join(folder, name) for name in os.listdir(folder) if name.endswith(".img")]
+                stock[(character, scene)] = sorted(files, key=os.path.getmtime)
+        return stock
+
+    def _store(self, slot: tuple, data: bytes) -> str:
+        folder = os.path.join(self.root, *slot)
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"{uuid.uuid4().hex}.img")
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+        return path
+
+    def _check_low(self, slot: tuple):
+        if len(self._stock[slot]) < self.low_water:
+            self._low_since.setdefault(slot, time.monotonic())
+
+    async def load(self):
+        """Index stocked images and mark empty default slots for refill"""
+        try:
+            for slot, files in (await asyncio.to_thread(self._scan)).items():
+                self._stock[slot] = deque(files)
+                self._wanted.add(slot)
+            for character in list_characters():
+                self._wanted.add((character["file"], DEFAULT_SCENE))
+            for slot in self._wanted:
+                self._check_low(slot)
+            logger.info(f"Image inventory loaded: {sum(map(len, self._stock.values()))} images")
+        except Exception as e:
+            logger.error(f"Failed to load image inventory: {e}")
+
+    async def take(self, character: str, scene: str = DEFAULT_SCENE) -> Optional[bytes]:
+        """Pop a stocked image for character and scene, None on miss"""
+        slot = (character, scene)
+        self._wanted.add(slot)
+        stock = self._stock[slot]
+        data = None
+        while stock and data is None:
+            try:
+                data = await asyncio.to_thread(_take_file, stock.popleft())
+            except OSError as e:
+                logger.warning(f"Inventory file unavailable: {e}")
+
+        if data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        self._check_low(slot)
+        return data
+
+    def _idle(self) -> bool:
+        limiter = limiters["image"]
+        return limiter.active < INVENTORY_IDLE_ACTIVE and not limiter.queued
+
+    async def refill_once(self) -> bool:
+        """Generate one image for the emptiest slot being refilled"""
+        if not self._low_since:
+            return False
+        slot = min(self._low_since, key=lambda s: (len(self._stock[s]), self._low_since[s]))
+        try:
+            character = load_character(slot[0])
+        except FileNotFoundError:
+            # Character was removed: stop stocking it
+            self._wanted.discard(slot)
+            self._low_since.pop(slot, None)
+            return False
+
+        data = await generate_clean(scene_prompt(character, slot[1]), f"{slot[0]}_lora", PRIORITY_BACKGROUND)
+        self._stock[slot].append(await asyncio.to_thread(self._store, slot, data))
+        self.refills += 1
+
+        if len(self._stock[slot]) >= self.high_water:
+            lag = time.monotonic() - self._low_since.pop(slot)
+            self.refill_lags.append(lag)
+            logger.info(f"Inventory {slot[0]}/{slot[1]} refilled in {lag:.0f}s")
+        return True
+
+    async def refiller(self, interval: float = INVENTORY_REFILL_INTERVAL):
+        """Refill at most one image per interval, only while the image backend is quiet"""
+        while True:
+            await asyncio.sleep(interval)
+            if not self._idle():
+                continue
+            try:
+                await self.refill_once()
+            except (UpstreamError, QueueTimeout) as e:
+                self.refill_errors += 1
+                logger.warning(f"Inventory refill failed: {e}")
+            except Exception as e:
+                self.refill_errors += 1
+                logger.error(f"Inventory refill failed: {e}")
+
+    def metrics(self) -> dict:
+        """Hit rate, stock and refill lag"""
+        requests = self.hits + self.misses
+        now = time.monotonic()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / requests, 3) if requests else 0.0,
+            "stock": sum(map(len, self._stock.values())),
+            "refilling": len(self._low_since),
+            "refills": self.refills,
+            "refill_errors": self.refill_errors,
+            "refill_lag_avg": round(sum(self.refill_lags) / len(self.refill_lags), 1) if self.refill_lags else None,
+            "refill_lag_max": round(max(self.refill_lags), 1) if self.refill_lags else None,
+            "pending_lag": round(now - min(self._low_since.values()), 1) if self._low_since else 0.0
+        }
+
+image_inventory = ImageInventory()
@@ -0,0 +1,142 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from config.settings import UPSTREAM_LIMITS
+import logging
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_VIP = 0
+PRIORITY_TRIAL = 1
+PRIORITY_BACKGROUND = 2  # inventory refills and other prefetching
+
+class QueueTimeout(Exception):
+    """Request waited in queue longer than backend deadline and was shed"""
+
+class UpstreamError(Exception):
+    """Upstream returned a non-success response"""
+
+def priority_for(user) -> int:
+    """Queue priority for user: VIP ahead of trial"""
+    vip_until = getattr(user, "vip_until", None)
+    if vip_until and vip_until > datetime.utcnow():
+        return PRIORITY_VIP
+    return PRIORITY_TRIAL
+
+class Permit:
+    """Held limiter slot; streaming callers report their time to first byte as latency"""
+
+    __slots__ = ("acquired", "latency")
+
+    def __init__(self):
+        self.acquired = time.monotonic()
+        self.latency = None
+
+    def first_byte(self):
+        if self.latency is None:
+            self.latency = time.monotonic() - self.acquired
+
+    def elapsed(self) -> float:
+        return self.latency if self.latency is not None else time.monotonic() - self.acquired
+
+class AdaptiveLimiter:
+    """Concurrency limit for one upstream backend (AIMD on latency and errors)"""
+
+    def __init__(self, name: str, initial: int, min_limit: int, max_limit: int,
+                 target_latency: float, queue_deadline: float):
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.queue_deadline = queue_deadline
+        self.active = 0
+        self._queue = []  # heap of [priority, seq, enqueued_at, future]
+        self._seq = itertools.count()
+        self.latency_ewma = 0.0
+        self.stats = {"completed": 0, "errors": 0, "shed": 0, "max_wait": 0.0}
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for entry in self._queue if not entry[3].done())
+
+    def snapshot(self) -> dict:
+        """Current limiter state for metrics"""
+        return {
+            "limit": int(self.limit),
+            "active": self.active,
+            "queued": self.queued,
+            "latency_ewma": round(self.latency_ewma, 3),
+            **self.stats
+        }
+
+    def _wake(self):
+        """Hand free slots to queued requests in priority order"""
+        while self._queue and self.active < int(self.limit):
+            _, _, enqueued_at, future = heapq.heappop(self._queue)
+            if future.done():
+                continue  # waiter timed out or was cancelled
+            self.active += 1
+            self.stats["max_wait"] = max(self.stats["max_wait"], time.monotonic() - enqueued_at)
+            future.set_result(None)
+
+    async def _acquire(self, priority: int):
+        if self.active < int(self.limit) and not self.queued:
+            self.active += 1
+            return
+
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(self._queue, [priority, next(self._seq), time.monotonic(), future])
+        try:
+            await asyncio.wait_for(future, self.queue_deadline)
+        except asyncio.TimeoutError:
+            self.stats["shed"] += 1
+            logger.warning(f"{self.name}: shed request after {self.queue_deadline}s in queue")
+            raise QueueTimeout(f"{self.name} queue wait exceeded {self.queue_deadline}s")
+        except asyncio.CancelledError:
+            # Slot may have been granted right before cancellation
+            if future.done() and not future.cancelled():
+                self.active -= 1
+                self._wake()
+            raise
+
+    def _release(self, latency: float = None, error: bool = False):
+        self.active -= 1
+        if latency is not None:
+            self.stats["completed"] += 1
+            self.latency_ewma = latency if not self.latency_ewma else 0.8 * self.latency_ewma + 0.2 * latency
+            if error:
+                self.stats["errors"] += 1
+                self.limit = max(self.min_limit, self.limit * 0.7)
+            elif latency > self.target_latency:
+                self.limit = max(self.min_limit, self.limit * 0.9)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_TRIAL):
+        """Hold one concurrency slot for the duration of an upstream call"""
+        await self._acquire(priority)
+        permit = Permit()
+        try:
+            yield permit
+        except Exception:
+            self._release(permit.elapsed(), error=True)
+            raise
+        except BaseException:
+            # Cancelled or closed early: says nothing about backend health
+            self._release()
+            raise
+        else:
+            # Streams hold the slot for the whole reply; AIMD sees their first-byte latency
+            self._release(permit.elapsed())
+
+limiters = {name: AdaptiveLimiter(name, **config) for name, config in UPSTREAM_LIMITS.items()}
+
+def limiter_stats() -> dict:
+    """Snapshot of all backend limiters"""
+    return {name: limiter.snapshot() for name, limiter in limiters.items()}
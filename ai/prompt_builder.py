@@ -0,0 +1,128 @@
+import hashlib
+import math
+import re
+from config.settings import PROMPT_TOKEN_BUDGET, SUMMARY_TOKEN_BUDGET, SUMMARY_LINE_CHARS
+import logging
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+MESSAGE_OVERHEAD = 4  # role + separators per chat message
+LEGACY_HISTORY_TURNS = 10  # what TextLLM used to send blindly
+
+def estimate_tokens(text: str) -> int:
+    """Estimate BPE token count locally (no tokenizer download)"""
+    if not text:
+        return 0
+    tokens = 0
+    for piece in _TOKEN_RE.findall(text):
+        if piece.isascii():
+            tokens += max(1, math.ceil(len(piece) / 4))
+        elif piece.isalnum():
+            # Cyrillic words split into noticeably more pieces than Latin
+            tokens += max(1, math.ceil(len(piece) / 3))
+        else:
+            tokens += 2  # emoji and other symbols
+    return tokens
+
+def message_tokens(message: dict) -> int:
+    """Estimate tokens of one chat message"""
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD
+
+def turn_fingerprint(turn: dict) -> str:
+    """Stable id of a history turn (survives restarts, unlike hash())"""
+    raw = f"{turn.get('user', '')}\x00{turn.get('assistant', '')}"
+    return hashlib.md5(raw.encode()).hexdigest()[:12]
+
+def _shorten(text: str, limit: int) -> str:
+    """Cut text to first sentence or limit chars"""
+    text = " ".join(text.split())
+    match = re.search(r"[.!?…](\s|$)", text)
+    if match and match.end() <= limit:
+        return text[:match.end()].strip()
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
+
+class PromptBuilder:
+    """Packs chat history into a token budget, folding older turns into a summary"""
+
+    def __init__(self, token_budget: int = PROMPT_TOKEN_BUDGET, summary_budget: int = SUMMARY_TOKEN_BUDGET):
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+        self.stats = {"requests": 0, "prompt_tokens": 0, "tokens_saved": 0}
+
+    def _cut_index(self, history: list) -> int:
+        """Index of the oldest turn that still fits the budget"""
+        used = 0
+        cut = len(history)
+        for i in range(len(history) - 1, -1, -1):
+            turn = history[i]
+            cost = (estimate_tokens(turn.get("user", "")) + estimate_tokens(turn.get("assistant", ""))
+                    + 2 * MESSAGE_OVERHEAD)
+            if used + cost > self.token_budget:
+                break
+            used += cost
+            cut = i
+        return cut
+
+    def fold(self, summary: dict, history: list, cut: int) -> bool:
+        """Fold turns older than cut into summary incrementally, return True if changed"""
+        # Search the whole history: when the verbatim window grows, the last
+        # folded turn can sit after cut and nothing before it may be re-folded
+        fingerprints = [turn_fingerprint(turn) for turn in history]
+        start = 0
+        last = summary.get("last")
+        if last in fingerprints:
+            start = len(fingerprints) - fingerprints[::-1].index(last)
+        if start >= cut:
+            return False
+
+        lines = summary.setdefault("lines", [])
+        for turn in history[start:cut]:
+            lines.append(
+                f"— он: {_shorten(turn.get('user', ''), SUMMARY_LINE_CHARS)}"
+                f" / она: {_shorten(turn.get('assistant', ''), SUMMARY_LINE_CHARS)}"
+            )
+        summary["last"] = fingerprints[cut - 1]
+
+        # Keep summary inside its own budget, forgetting the oldest lines first
+        while lines and sum(estimate_tokens(line) for line in lines) > self.summary_budget:
+            lines.pop(0)
+        return True
+
+    async def build(self, prompt: str, chat_history: list = None, user_id: int = None,
+                    cache=None, system_tokens: int = 0) -> list:
+        """Assemble messages that follow the system prompt within token budget"""
+        history = chat_history or []
+        cut = self._cut_index(history)
+
+        summary = None
+        if cache is not None and user_id is not None:
+            summary = await cache.get_history_summary(user_id) or {"lines": [], "last": None}
+            if self.fold(summary, history, cut):
+                await cache.set_history_summary(user_id, summary)
+
+        messages = []
+        if summary and summary.get("lines"):
+            messages.append({
+                "role": "system",
+                "content": "Краткое содержание ранней переписки:\n" + "\n".join(summary["lines"])
+            })
+        for turn in history[cut:]:
+            messages.append({"role": "user", "content": turn.get("user", "")})
+            messages.append({"role": "assistant", "content": turn.get("assistant", "")})
+        messages.append({"role": "user", "content": prompt})
+
+        # Compare with the old "last 10 turns verbatim" prompt
+        prompt_tokens = system_tokens + sum(message_tokens(m) for m in messages)
+        legacy_tokens = system_tokens + message_tokens({"content": prompt})
+        for turn in history[-LEGACY_HISTORY_TURNS:]:
+            legacy_tokens += (estimate_tokens(turn.get("user", "")) + estimate_tokens(turn.get("assistant", ""))
+                              + 2 * MESSAGE_OVERHEAD)
+        self.stats["requests"] += 1
+        self.stats["prompt_tokens"] += prompt_tokens
+        self.stats["tokens_saved"] += legacy_tokens - prompt_tokens
+        logger.info(
+            f"Prompt for {user_id}: {prompt_tokens} tokens, {len(history) - cut} turns verbatim, "
+            f"saved {legacy_tokens - prompt_tokens} vs legacy"
+        )
+        return messages
@@ -0,0 +1,222 @@
+import asyncio
+import time
+from collections import Counter, defaultdict, deque
+from typing import AsyncIterator, Awaitable, Callable, Optional
+from config.settings import LLM_MODELS, LLM_HEDGE_DELAY, LLM_STATS_WINDOW, LLM_MAX_ERROR_RATE
+from ai.limiter import QueueTimeout
+import logging
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.5, 1, 2, 4, 8, 16, 32)  # seconds, upper bounds
+MIN_SAMPLES = 20  # before p95 replaces the default hedge delay
+
+class ModelStats:
+    """Rolling latency and error stats for one model"""
+
+    def __init__(self, window: int = LLM_STATS_WINDOW):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)  # True for errors
+        self.requests = 0
+        self.errors = 0
+        self.wins = 0
+        self.hedges = 0
+
+    def record(self, latency: float = None, error: bool = False):
+        self.requests += 1
+        self.outcomes.append(error)
+        if error:
+            self.errors += 1
+        else:
+            self.latencies.append(latency)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if len(self.latencies) < MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    @property
+    def error_rate(self) -> float:
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    def histogram(self) -> dict:
+        buckets = Counter()
+        for latency in self.latencies:
+            bound = next((b for b in LATENCY_BUCKETS if latency <= b), "inf")
+            buckets[f"le_{bound}"] += 1
+        return dict(buckets)
+
+    def snapshot(self) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": round(self.error_rate, 3),
+            "wins": self.wins,
+            "hedges": self.hedges,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "histogram": self.histogram()
+        }
+
+class Attempt:
+    """One launched call; its hedge clock starts once it is admitted past the local limiter"""
+
+    __slots__ = ("model", "launched", "admitted_at", "admitted")
+
+    def __init__(self, model: str):
+        self.model = model
+        self.launched = time.monotonic()
+        self.admitted_at = None
+        self.admitted = asyncio.Event()
+
+    def admit(self):
+        if self.admitted_at is None:
+            self.admitted_at = time.monotonic()
+            self.admitted.set()
+
+    @property
+    def latency(self) -> float:
+        return time.monotonic() - (self.admitted_at or self.launched)
+
+class ModelRouter:
+    """Routes completions over an ordered model list with hedged fallback requests"""
+
+    def __init__(self, default_models: list = None, hedge_delay: float = LLM_HEDGE_DELAY):
+        self.default_models = default_models or LLM_MODELS
+        self.default_hedge_delay = hedge_delay
+        self.stats = defaultdict(ModelStats)  # full completion latency
+        self.stream_stats = defaultdict(ModelStats)  # time to first chunk
+        self.choices = Counter()
+
+    def models_for(self, character: dict) -> list:
+        """Ordered model list for character, unhealthy models moved to the back"""
+        models = character.get("models") or self.default_models
+        healthy = [
+            m for m in models
+            if self.stats[m].error_rate <= LLM_MAX_ERROR_RATE and self.stream_stats[m].error_rate <= LLM_MAX_ERROR_RATE
+        ]
+        return healthy + [m for m in models if m not in healthy]
+
+    def hedge_delay(self, model: str, stats: dict = None) -> float:
+        """How long to wait for admitted model before hedging: its p95 once known"""
+        stats = self.stats if stats is None else stats
+        return stats[model].percentile(0.95) or self.default_hedge_delay
+
+    def snapshot(self) -> dict:
+        """Routing choices and per-model latency histograms for tuning"""
+        return {
+            "choices": dict(self.choices),
+            "models": {model: stats.snapshot() for model, stats in self.stats.items()},
+            "streams": {model: stats.snapshot() for model, stats in self.stream_stats.items()}
+        }
+
+    async def _race(self, models: list, start: Callable[[str, Callable[[], None]], Awaitable], stats: dict):
+        """Run start(model, admit) on primary, hedge to next models; return (model, result, losers)"""
+        # start calls admit() once it holds its local limiter slot: time queued locally
+        # neither triggers hedges nor counts as model latency
+        self.choices[models[0]] += 1
+        pending = {}
+        queue = list(models)
+        last_error = None
+
+        def launch():
+            attempt = Attempt(queue.pop(0))
+            task = asyncio.ensure_future(start(attempt.model, attempt.admit))
+            pending[task] = attempt
+
+        launch()
+        try:
+            while pending:
+                primary = next(iter(pending.values()))
+                waiter = None
+                timeout = None
+                if queue and len(pending) == 1:
+                    if primary.admitted_at is None:
+                        # Still queued locally: wait for admission, not for a hedge
+                        waiter = asyncio.ensure_future(primary.admitted.wait())
+                    else:
+                        elapsed = time.monotonic() - primary.admitted_at
+                        timeout = max(0.0, self.hedge_delay(primary.model, stats) - elapsed)
+                try:
+                    done, _ = await asyncio.wait(
+                        [*pending, waiter] if waiter else pending,
+                        timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                    )
+                finally:
+                    if waiter:
+                        waiter.cancel()
+                done.discard(waiter)
+
+                if not done:
+                    if waiter:
+                        continue  # admitted: loop again to arm the hedge timer
+                    # Primary is slower than its p95: fire the fallback, keep both
+                    stats[queue[0]].hedges += 1
+                    logger.info(f"Hedging {primary.model} with {queue[0]}")
+                    launch()
+                    continue
+
+                for task in done:
+                    attempt = pending.pop(task)
+                    if task.exception() is None:
+                        stats[attempt.model].record(attempt.latency)
+                        stats[attempt.model].wins += 1
+                        for loser in pending.values():
+                            if loser.admitted_at is not None:
+                                # Only a lower bound, but dropping the slow attempts the hedge
+                                # cut short would bias p95 low and hedge ever more often
+                                stats[loser.model].record(loser.latency)
+                        return attempt.model, task.result(), pending
+                    last_error = task.exception()
+                    if isinstance(last_error, QueueTimeout):
+                        # Shed by our own limiter: says nothing about the model, and a
+                        # fallback would only wait in the same queue
+                        logger.warning(f"Model {attempt.model} not tried: {last_error}")
+                        continue
+                    stats[attempt.model].record(error=True)
+                    logger.warning(f"Model {attempt.model} failed: {last_error}")
+                    if queue and not pending:
+                        launch()
+        except BaseException:
+            for task in pending:
+                task.cancel()
+            raise
+        raise last_error
+
+    async def _cancel(self, losers: dict):
+        for task in losers:
+            task.cancel()
+        if losers:
+            await asyncio.wait(losers)
+
+    async def route(self, models: list, call: Callable[[str, Callable[[], None]], Awaitable[str]]) -> str:
+        """Complete with first model to answer; the loser is cancelled"""
+        model, result, losers = await self._race(models, call, self.stats)
+        await self._cancel(losers)
+        return result
+
+    async def route_stream(self, models: list,
+                           open_stream: Callable[[str, Callable[[], None]], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """Stream from first model to produce a chunk (latency is time to first chunk)"""
+        streams = {}
+
+        async def first_chunk(model: str, admit: Callable[[], None]):
+            stream = streams[model] = open_stream(model, admit)
+            return await stream.__anext__()
+
+        model, chunk, losers = await self._race(models, first_chunk, self.stream_stats)
+        await self._cancel(losers)
+        for attempt in losers.values():
+            # A loser cancelled before it ran never opened a stream
+            loser = streams.get(attempt.model)
+            if loser is not None:
+                await loser.aclose()
+
+        stream = streams[model]
+        try:
+            yield chunk
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
@@ -0,0 +1,67 @@
+import re
+from typing import Optional, Tuple
+from config.settings import MAX_PROMPT_ATTRIBUTES
+
+DEFAULT_SCENE = "selfie"
+CANON_VERSION = 1  # bump when fragments change so old cache keys stop matching
+
+# tag -> (trigger word stems, prompt fragment)
+SCENES = {
+    "selfie": ((), "селфи, смотрит в камеру"),
+    "bedroom": (("спальн", "кроват", "постел"), "в спальне на кровати"),
+    "lingerie": (("бель", "бельё", "чулк"), "в кружевном белье"),
+    "shower": (("душ", "ванн"), "в ванной комнате"),
+    "beach": (("пляж", "море", "моря", "морю", "морем", "морск", "купальник"), "на пляже в купальнике"),
+    "cosplay": (("косплей", "костюм"), "в костюме для косплея"),
+}
+
+ATTRIBUTES = {
+    "smile": (("улыб",), "улыбается"),
+    "glasses": (("очк",), "в очках"),
+    "closeup": (("лицо", "крупн", "портрет"), "крупный план"),
+    "back": (("сзади", "спин"), "вид сзади"),
+    "night": (("ноч", "вечер"), "вечернее освещение"),
+}
+
+Tags = Tuple[str, Tuple[str, ...]]
+
+def _pattern(stems: Tuple[str, ...]) -> re.Pattern:
+    """Regex matching any stem at the start of a word"""
+    return re.compile(r"\b(?:" + "|".join(map(re.escape, stems)) + ")")
+
+_SCENE_PATTERNS = {tag: _pattern(stems) for tag, (stems, _) in SCENES.items() if stems}
+_ATTRIBUTE_PATTERNS = {tag: _pattern(stems) for tag, (stems, _) in ATTRIBUTES.items()}
+
+def _words(text: Optional[str]) -> str:
+    """Lowercase text with punctuation and emoji reduced to single spaces"""
+    return " ".join(re.findall(r"\w+", (text or "").lower()))
+
+def scene_for(text: Optional[str], character: dict = None) -> str:
+    """Scene tag for free-text photo request, limited to scenes the character allows"""
+    allowed = (character or {}).get("scenes") or SCENES
+    text = _words(text)
+    for tag, pattern in _SCENE_PATTERNS.items():
+        if tag in allowed and pattern.search(text):
+            return tag
+    return DEFAULT_SCENE
+
+def canonicalize(character: dict, text: Optional[str]) -> Tags:
+    """Map free text onto (scene, sorted attribute tags) for character"""
+    words = _words(text)
+    attributes = [tag for tag, pattern in _ATTRIBUTE_PATTERNS.items() if pattern.search(words)]
+    return scene_for(text, character), tuple(sorted(attributes)[:MAX_PROMPT_ATTRIBUTES])
+
+def canonical_key(character: dict, tags: Tags) -> str:
+    """Cache key from character and tag set, independent of wording"""
+    scene, attributes = tags
+    return f"v{CANON_VERSION}|{character['file']}|{scene}|{','.join(attributes)}"
+
+def canonical_prompt(character: dict, tags: Tags) -> str:
+    """Generation prompt for character from tag set"""
+    scene, attributes = tags
+    fragments = [SCENES[scene][1]] + [ATTRIBUTES[tag][1] for tag in attributes]
+    return f"красивая русская девушка {character['name']} {character['age']} лет, обнажённая, реалистично, {', '.join(fragments)}"
+
+def scene_prompt(character: dict, tag: str) -> str:
+    """Generation prompt for character in scene"""
+    return canonical_prompt(character, (tag, ()))
@@ -1,62 +1,174 @@
 import aiohttp
 import json
-from config.settings import OPENROUTER_API_KEY
+import time
+from typing import AsyncIterator, Callable, Optional
+from config.settings import (
+    OPENROUTER_API_KEY, LLM_POOL_LIMIT, LLM_POOL_LIMIT_PER_HOST,
+    LLM_KEEPALIVE_TIMEOUT, LLM_TIMEOUT, LLM_MODELS, LLM_CONNECT_TIMEOUT, LLM_STREAM_READ_TIMEOUT
+)
+from ai.prompt_builder import PromptBuilder
+from ai.router import ModelRouter
+from ai.templates import RequestTemplate, template_for
+from ai.limiter import limiters, PRIORITY_TRIAL, QueueTimeout, UpstreamError
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Streams may run longer than LLM_TIMEOUT: bound connecting and gaps between chunks instead
+STREAM_TIMEOUT = aiohttp.ClientTimeout(
+    total=None, sock_connect=LLM_CONNECT_TIMEOUT, sock_read=LLM_STREAM_READ_TIMEOUT
+)
+
 class TextLLM:
     def __init__(self, api_key: str = OPENROUTER_API_KEY):
         self.api_key = api_key
         self.base_url = "https://openrouter.ai/api/v1"
-        self.model = "deepseek/deepseek-r1-abliterated"
+        self.model = LLM_MODELS[0]
+        self.router = ModelRouter(LLM_MODELS)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.prompt_builder = PromptBuilder()
+
+    async def start(self):
+        """Open long-lived HTTP session with a bounded keep-alive pool"""
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=LLM_POOL_LIMIT,
+            limit_per_host=LLM_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=LLM_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=300
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=LLM_TIMEOUT, sock_connect=LLM_CONNECT_TIMEOUT),
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json"
+            }
+        )
+        logger.info(f"LLM session opened (limit={LLM_POOL_LIMIT}, per_host={LLM_POOL_LIMIT_PER_HOST})")
+
+    async def close(self):
+        """Close HTTP session and its pooled connections"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info("LLM session closed")
+        self._session = None
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Get shared session, opening it lazily if needed"""
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
+
+    def pool_stats(self) -> dict:
+        """Get connection pool stats: open, idle and waiting connections"""
+        if self._session is None or self._session.closed:
+            return {"open": 0, "idle": 0, "waiting": 0}
+        connector = self._session.connector
+        # aiohttp keeps no public counters, read connector internals defensively
+        idle = sum(len(conns) for conns in getattr(connector, "_conns", {}).values())
+        acquired = len(getattr(connector, "_acquired", ()))
+        waiting = sum(len(waiters) for waiters in getattr(connector, "_waiters", {}).values())
+        return {"open": acquired + idle, "idle": idle, "waiting": waiting}
+
+    async def _build_messages(self, prompt: str, template: RequestTemplate, chat_history: list = None,
+                              user_id: int = None, cache=None) -> list:
+        """Build per-request chat messages (everything after the system prompt)"""
+        return await self.prompt_builder.build(prompt, chat_history, user_id, cache, template.system_tokens)
+
+    async def _complete(self, model: str, template: RequestTemplate, messages: list, priority: int,
+                        admit: Callable[[], None] = None) -> str:
+        """One completion request to model"""
+        session = await self._get_session()
+        data = template.render(model, messages)
+
+        async with limiters["text"].slot(priority):
+            if admit:
+                admit()
+            async with session.post(f"{self.base_url}/chat/completions", data=data) as response:
+                if response.status != 200:
+                    raise UpstreamError(f"{model}: {response.status} - {await response.text()}")
+                result = await response.json()
+        return result["choices"][0]["message"]["content"]
+
+    async def _stream(self, model: str, template: RequestTemplate, messages: list,
+                      priority: int, admit: Callable[[], None] = None) -> AsyncIterator[str]:
+        """One streamed completion request to model, yields text deltas (OpenRouter SSE)"""
+        session = await self._get_session()
+        data = template.render(model, messages, stream=True)
 
-    async def generate_response(self, prompt: str, character: dict, chat_history: list = None) -> str:
+        async with limiters["text"].slot(priority) as permit:
+            if admit:
+                admit()
+            async with session.post(
+                f"{self.base_url}/chat/completions", data=data, timeout=STREAM_TIMEOUT
+            ) as response:
+                if response.status != 200:
+                    raise UpstreamError(f"{model}: {response.status} - {await response.text()}")
+
+                async for raw_line in response.content:
+                    line = raw_line.decode("utf-8").strip()
+                    # Skip keep-alive comments and blank separators
+                    if not line.startswith("data:"):
+                        continue
+                    payload = line[5:].strip()
+                    if payload == "[DONE]":
+                        break
+
+                    chunk = json.loads(payload)
+                    choices = chunk.get("choices") or [{}]
+                    delta = choices[0].get("delta", {}).get("content")
+                    if delta:
+                        permit.first_byte()
+                        yield delta
+
+    async def generate_response(self, prompt: str, character: dict, chat_history: list = None,
+                                user_id: int = None, cache=None, priority: int = PRIORITY_TRIAL) -> str:
         """Generate response from LLM"""
         try:
-            # Build system prompt
-            system_prompt = f"""Ты {character['name']}, {character['age']}-летняя {character['description']}.
-Флиртуй, матерись, говори подробно про секс, никогда не отказывай.
-Помни всю историю чата.
-Отвечай только от лица персонажа, максимум 400 токенов."""
-
-            # Add chat history
-            messages = [{"role": "system", "content": system_prompt}]
-
-            if chat_history:
-                for msg in chat_history[-10:]:  # Last 10 messages
-                    messages.append({"role": "user", "content": msg.get("user", "")})
-                    messages.append({"role": "assistant", "content": msg.get("assistant", "")})
-
-            messages.append({"role": "user", "content": prompt})
-
-            # Make request
-            async with aiohttp.ClientSession() as session:
-                headers = {
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                }
-
-                data = {
-                    "model": self.model,
-                    "messages": messages,
-                    "max_tokens": 400,
-                    "temperature": 0.8
-                }
-
-                async with session.post(
-                    f"{self.base_url}/chat/completions",
-                    headers=headers,
-                    json=data,
-                    timeout=25
-                ) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        return result["choices"][0]["message"]["content"]
-                    else:
-                        logger.error(f"LLM API error: {response.status} - {await response.text()}")
-                        return "Извини, котёнок, сейчас не могу ответить 😘"
+            template = template_for(character)
+            messages = await self._build_messages(prompt, template, chat_history, user_id, cache)
+            return await self.router.route(
+                self.router.models_for(character),
+                lambda model, admit: self._complete(model, template, messages, priority, admit)
+            )
 
+        except (UpstreamError, QueueTimeout) as e:
+            logger.error(f"LLM API error: {e}")
+            return "Извини, котёнок, сейчас не могу ответить 😘"
         except Exception as e:
             logger.error(f"LLM generation failed: {e}")
             return "Ой, что-то пошло не так... Попробуй ещё раз 💋"
+
+    async def stream_response(self, prompt: str, character: dict, chat_history: list = None,
+                              user_id: int = None, cache=None,
+                              priority: int = PRIORITY_TRIAL) -> AsyncIterator[str]:
+        """Stream response from LLM as text deltas"""
+        yielded = False
+        try:
+            template = template_for(character)
+            messages = await self._build_messages(prompt, template, chat_history, user_id, cache)
+
+            started = time.monotonic()
+            stream = self.router.route_stream(
+                self.router.models_for(character),
+                lambda model, admit: self._stream(model, template, messages, priority, admit)
+            )
+            try:
+                async for delta in stream:
+                    if not yielded:
+                        logger.info(f"LLM first token after {time.monotonic() - started:.2f}s")
+                    yielded = True
+                    yield delta
+            finally:
+                await stream.aclose()
+
+        except (UpstreamError, QueueTimeout) as e:
+            logger.error(f"LLM API error: {e}")
+            if not yielded:
+                yield "Извини, котёнок, сейчас не могу ответить 😘"
+        except Exception as e:
+            logger.error(f"LLM streaming failed: {e}")
+            if not yielded:
+                yield "Ой, что-то пошло не так... Попробуй ещё раз 💋"
@@ -0,0 +1,49 @@
+import hashlib
+from collections import OrderedDict
+from typing import Optional
+from config.settings import VOICE_CACHE_BYTES
+import logging
+
+logger = logging.getLogger(__name__)
+
+def audio_key(text: str, speaker: str, prosody: str) -> str:
+    """Content address of synthesized audio"""
+    return hashlib.sha256(f"{prosody}\x00{speaker}\x00{text}".encode()).hexdigest()
+
+class AudioCache:
+    """Byte-budgeted LRU of encoded voice notes"""
+
+    def __init__(self, max_bytes: int = VOICE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._data: "OrderedDict[str, bytes]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._data
+
+    def get(self, key: str) -> Optional[bytes]:
+        audio = self._data.get(key)
+        if audio is None:
+            self.stats["misses"] += 1
+            return None
+        self._data.move_to_end(key)
+        self.stats["hits"] += 1
+        return audio
+
+    def put(self, key: str, audio: bytes):
+        if len(audio) > self.max_bytes:
+            return
+        if key in self._data:
+            self.size -= len(self._data.pop(key))
+        self._data[key] = audio
+        self.size += len(audio)
+        while self.size > self.max_bytes:
+            _, evicted = self._data.popitem(last=False)
+            self.size -= len(evicted)
+            self.stats["evictions"] += 1
+
+    def metrics(self) -> dict:
+        return {"entries": len(self._data), "bytes": self.size, **self.stats}
+
+audio_cache = AudioCache()
@@ -1,91 +1,400 @@
 import torch
 import io
-from config.settings import VOICE_TIMEOUT
+import os
+import re
+import inspect
+import time
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import Counter
+from typing import Optional
+from config.settings import (
+    VOICE_TIMEOUT, TTS_WORKERS, TTS_THREADS_PER_WORKER, TTS_SEGMENT_CHARS, VOICE_SAMPLE_RATE,
+    TTS_BATCH_WINDOW, TTS_MAX_BATCH, TTS_BATCH_MAX_CHARS, TTS_MODEL_PATH, TTS_OFFLINE, TTS_LOAD_TIMEOUT
+)
+from ai.audio_codec import OpusEncoder, encode_ogg_opus
+from ai.voice_cache import audio_cache, audio_key
+from ai.limiter import limiters, priority_for, PRIORITY_TRIAL, QueueTimeout
+from utils.singleflight import SingleFlight
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Global model cache
+VOICE_PROSODY = 'rate="slow" pitch="+2st"'  # SSML for emotions
+WARMUP_TEXT = "Привет!"
+WAIT_BUCKETS_MS = (5, 10, 25, 50, 100, 250)
+
+# Global model cache (one per worker process)
 _model = None
+_load_seconds = None
 _device = torch.device('cpu')
 
 def load_model():
-    """Load Silero TTS model"""
-    global _model
+    """Load Silero TTS model, from the pinned local package when present"""
+    global _model, _load_seconds
     if _model is None:
+        started = time.monotonic()
         try:
-            _model = torch.hub.load(
-                'snakers4/silero-models',
-                'silero_tts',
-                language='ru',
-                speaker='v5_ru',
-                verbose=False
-            )
+            if os.path.exists(TTS_MODEL_PATH):
+                importer = torch.package.PackageImporter(TTS_MODEL_PATH)
+                _model = importer.load_pickle("tts_models", "model")
+                source = TTS_MODEL_PATH
+            elif TTS_OFFLINE:
+                raise FileNotFoundError(f"{TTS_MODEL_PATH} not found and TTS_OFFLINE is set")
+            else:
+                _model = torch.hub.load(
+                    'snakers4/silero-models',
+                    'silero_tts',
+                    language='ru',
+                    speaker='v5_ru',
+                    verbose=False
+                )
+                source = "torch.hub"
             _model.to(_device)
-            logger.info("Silero TTS model loaded")
+            _load_seconds = time.monotonic() - started
+            logger.info(f"Silero TTS model loaded from {source} in {_load_seconds:.1f}s")
         except Exception as e:
             logger.error(f"Failed to load TTS model: {e}")
             _model = None
     return _model
 
-async def generate_voice(text: str, speaker: str = 'xenia', user=None) -> io.BytesIO:
-    """Generate voice from text"""
-    try:
-        model = load_model()
-        if model is None:
-            return None
+def _init_worker(threads: int):
+    """Pin torch threads and load model once per worker process"""
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+    load_model()
+
+def warmup(speaker: str) -> dict:
+    """Worker: synthesize a short phrase so first real request is fast"""
+    started = time.monotonic()
+    synthesize(WARMUP_TEXT, speaker)
+    return {"load": _load_seconds, "synth": time.monotonic() - started}
+
+def _segments(text: str, max_chars: int = TTS_SEGMENT_CHARS) -> list:
+    """Split long text on sentence boundaries so each segment is synthesized separately"""
+    if len(text) <= max_chars:
+        return [text]
+    segments = []
+    current = ""
+    for sentence in re.split(r"(?<=[.!?…])\s+", text):
+        if current and len(current) + len(sentence) + 1 > max_chars:
+            segments.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}".strip()
+    if current:
+        segments.append(current)
+    return segments
+
+def synthesize(text: str, speaker: str = 'xenia', prosody: str = VOICE_PROSODY) -> bytes:
+    """Synthesize speech in current process, returns OGG/Opus voice note"""
+    model = load_model()
+    if model is None:
+        raise RuntimeError("TTS model is not loaded")
 
+    # Encode segment by segment: only one segment's waveform is alive at a time
+    encoder = OpusEncoder(VOICE_SAMPLE_RATE)
+    for segment in _segments(text):
         # SSML for emotions
-        ssml_text = f'<speak><prosody rate="slow" pitch="+2st">{text}</prosody></speak>'
+        ssml_text = f'<speak><prosody {prosody}>{segment}</prosody></speak>'
 
         # Generate audio
         audio = model.apply_tts(
             text=ssml_text,
             speaker=speaker,
-            sample_rate=24000
+            sample_rate=VOICE_SAMPLE_RATE
         )
+        encoder.feed(audio)
+        del audio
 
-        # Convert to bytes
-        buffer = io.BytesIO()
-        torch.save(audio, buffer)
-        buffer.seek(0)
+    return encoder.finish()
 
-        return buffer
+def synthesize_batch(texts: list, speaker: str = 'xenia', prosody: str = VOICE_PROSODY) -> list:
+    """Synthesize several short texts in one worker call, one OGG/Opus note per text"""
+    model = load_model()
+    if model is None:
+        raise RuntimeError("TTS model is not loaded")
 
-    except Exception as e:
-        logger.error(f"Voice generation failed: {e}")
-        return None
+    ssml_texts = [f'<speak><prosody {prosody}>{text}</prosody></speak>' for text in texts]
+    with torch.inference_mode():
+        if "texts" in inspect.signature(model.apply_tts).parameters:
+            # Packages with a list API run the whole batch in one forward pass
+            audios = model.apply_tts(texts=ssml_texts, speaker=speaker, sample_rate=VOICE_SAMPLE_RATE)
+        else:
+            audios = [
+                model.apply_tts(text=ssml_text, speaker=speaker, sample_rate=VOICE_SAMPLE_RATE)
+                for ssml_text in ssml_texts
+            ]
+    return [encode_ogg_opus(audio) for audio in audios]
 
-async def generate_voice_async(text: str, speaker: str = 'xenia', user=None) -> io.BytesIO:
-    """Async wrapper for generate_voice"""
-    import asyncio
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, generate_voice_sync, text, speaker, user)
+class TTSEngine:
+    """Silero TTS backed by a pool of worker processes"""
 
-def generate_voice_sync(text: str, speaker: str = 'xenia', user=None) -> io.BytesIO:
-    """Sync version for background execution"""
-    try:
-        model = load_model()
-        if model is None:
-            return None
+    def __init__(self, workers: int = TTS_WORKERS, threads: int = TTS_THREADS_PER_WORKER):
+        self.workers = workers
+        self.threads = threads
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._restart_task: Optional[asyncio.Task] = None
+        self.speakers = ['xenia']
+        self.in_flight = 0
+        self.ready = asyncio.Event()
+        self.stats = {"completed": 0, "failed": 0, "timeouts": 0, "not_ready": 0}
 
-        # SSML for emotions
-        ssml_text = f'<speak><prosody rate="slow" pitch="+2st">{text}</prosody></speak>'
+    def start(self):
+        """Start worker processes (model loads in each worker)"""
+        if self._pool is not None:
+            return
+        # spawn: forking a process that already holds torch threads is unsafe
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.threads,)
+        )
+        logger.info(f"TTS engine started ({self.workers} workers x {self.threads} threads)")
 
-        # Generate audio
-        audio = model.apply_tts(
-            text=ssml_text,
-            speaker=speaker,
-            sample_rate=24000
+    async def start_async(self, speakers: list):
+        """Start workers, load model and warm up every speaker without blocking the bot"""
+        started = time.monotonic()
+        speakers = self.speakers = speakers or ['xenia']
+        self.start()
+
+        # First job on each worker waits for its model load
+        stage = time.monotonic()
+        results = await asyncio.gather(*(
+            self._run(warmup, speakers[0], timeout=TTS_LOAD_TIMEOUT) for _ in range(self.workers)
+        ))
+        loads = [r["load"] for r in results if r and r["load"] is not None]
+        if not loads:
+            logger.error("TTS model failed to load, voice stays offline")
+            return
+        logger.info(
+            f"TTS stage load: {time.monotonic() - stage:.1f}s wall, "
+            f"model load {max(loads):.1f}s in {len(loads)}/{self.workers} workers"
         )
 
-        # Convert to bytes
-        buffer = io.BytesIO()
-        torch.save(audio, buffer)
-        buffer.seek(0)
+        for speaker in speakers[1:]:
+            stage = time.monotonic()
+            await asyncio.gather(*(self._run(warmup, speaker) for _ in range(self.workers)))
+            logger.info(f"TTS stage warmup {speaker}: {time.monotonic() - stage:.1f}s")
+
+        self.ready.set()
+        logger.info(f"TTS ready in {time.monotonic() - started:.1f}s")
 
-        return buffer
+    def _stop_pool(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
 
+    def _restart(self, pool: ProcessPoolExecutor):
+        """Replace a broken pool; a pool that was ready is re-warmed in the background"""
+        if self._pool is not pool:
+            return  # another job already replaced it
+        rewarm = self.ready.is_set()
+        self.ready.clear()
+        self._stop_pool()
+        # A pool dying during warmup is not restarted, or a worker that can't load would loop
+        if rewarm:
+            logger.error("TTS worker died, restarting pool")
+            self._restart_task = asyncio.ensure_future(self.start_async(self.speakers))
+        else:
+            logger.error("TTS worker died during warmup")
+
+    def shutdown(self):
+        """Stop worker processes for good"""
+        self.ready.clear()
+        if self._restart_task is not None:
+            self._restart_task.cancel()
+            self._restart_task = None
+        if self._pool is not None:
+            self._stop_pool()
+            logger.info("TTS engine stopped")
+
+    @property
+    def queue_depth(self) -> int:
+        """Jobs waiting for a free worker"""
+        return max(0, self.in_flight - self.workers)
+
+    def metrics(self) -> dict:
+        return {
+            "ready": self.ready.is_set(),
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            **self.stats
+        }
+
+    async def _run(self, fn, *args, timeout: float = VOICE_TIMEOUT):
+        """Run job in worker pool, None on failure or timeout"""
+        self.start()
+        pool = self._pool
+        loop = asyncio.get_event_loop()
+        self.in_flight += 1
+        try:
+            # A job already running in a worker can't be interrupted, it finishes in the background
+            result = await asyncio.wait_for(loop.run_in_executor(pool, fn, *args), timeout)
+            self.stats["completed"] += 1
+            return result
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            logger.error(f"Voice generation timed out after {timeout}s (queue depth {self.queue_depth})")
+            return None
+        except BrokenProcessPool:
+            self.stats["failed"] += 1
+            self._restart(pool)
+            return None
+        except Exception as e:
+            self.stats["failed"] += 1
+            logger.error(f"Voice generation failed: {e}")
+            return None
+        finally:
+            self.in_flight -= 1
+
+    async def submit(self, text: str, speaker: str = 'xenia', timeout: float = VOICE_TIMEOUT) -> Optional[bytes]:
+        """Synthesize one text in worker pool, None while voice is still starting"""
+        if not self.ready.is_set():
+            self.stats["not_ready"] += 1
+            return None
+        return await self._run(synthesize, text, speaker, timeout=timeout)
+
+    async def submit_batch(self, texts: list, speaker: str = 'xenia', timeout: float = VOICE_TIMEOUT) -> list:
+        """Synthesize several texts in one worker job"""
+        if not self.ready.is_set():
+            self.stats["not_ready"] += 1
+            return [None] * len(texts)
+        results = await self._run(synthesize_batch, texts, speaker, timeout=timeout)
+        return results or [None] * len(texts)
+
+tts_engine = TTSEngine()
+
+class TTSBatcher:
+    """Gathers short voice jobs per speaker for a short window and synthesizes them together"""
+
+    def __init__(self, engine: TTSEngine, window: float = TTS_BATCH_WINDOW,
+                 max_batch: int = TTS_MAX_BATCH, max_chars: int = TTS_BATCH_MAX_CHARS):
+        self.engine = engine
+        self.window = window
+        self.max_batch = max_batch
+        self.max_chars = max_chars
+        self._pending = {}  # speaker -> [(text, priority, future, enqueued_at)]
+        self._timers = {}
+        self._tasks = set()
+        self.batch_sizes = Counter()
+        self.wait_ms = Counter()
+
+    def metrics(self) -> dict:
+        """Batch-size and wait-time histograms"""
+        return {"batch_sizes": dict(self.batch_sizes), "wait_ms": dict(self.wait_ms)}
+
+    async def submit(self, text: str, speaker: str = 'xenia', priority: int = PRIORITY_TRIAL) -> Optional[bytes]:
+        """Synthesize text, batched with other short jobs for the same speaker"""
+        if len(text) > self.max_chars:
+            async with limiters["voice"].slot(priority):
+                return await self.engine.submit(text, speaker)
+
+        future = asyncio.get_event_loop().create_future()
+        batch = self._pending.setdefault(speaker, [])
+        batch.append((text, priority, future, time.monotonic()))
+        if len(batch) >= self.max_batch:
+            self._flush(speaker)
+        elif len(batch) == 1:
+            self._timers[speaker] = asyncio.get_event_loop().call_later(self.window, self._flush, speaker)
+        return await future
+
+    def _flush(self, speaker: str):
+        timer = self._timers.pop(speaker, None)
+        if timer:
+            timer.cancel()
+        batch = [job for job in self._pending.pop(speaker, []) if not job[2].done()]
+        if not batch:
+            return
+
+        now = time.monotonic()
+        self.batch_sizes[len(batch)] += 1
+        for _, _, _, enqueued_at in batch:
+            waited = (now - enqueued_at) * 1000
+            self.wait_ms[f"le_{next((b for b in WAIT_BUCKETS_MS if waited <= b), 'inf')}"] += 1
+
+        task = asyncio.ensure_future(self._run(speaker, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, speaker: str, batch: list):
+        futures = [future for _, _, future, _ in batch]
+        try:
+            # One limiter slot per batch, at the best priority inside it
+            async with limiters["voice"].slot(min(priority for _, priority, _, _ in batch)):
+                results = await self.engine.submit_batch([text for text, _, _, _ in batch], speaker)
+        except QueueTimeout as e:
+            logger.error(f"Voice batch skipped: {e}")
+            results = [None] * len(batch)
+        except asyncio.CancelledError:
+            for future in futures:
+                future.cancel()
+            raise
+        except Exception as e:
+            # Callers get the error; nobody awaits this task, so re-raising would only log it again
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, audio in zip(futures, results):
+            if not future.done():
+                future.set_result(audio)
+
+tts_batcher = TTSBatcher(tts_engine)
+
+# Same phrase for same speaker in flight is synthesized once
+voice_flights = SingleFlight("voice")
+
+async def _synthesize_cached(key: str, text: str, speaker: str, priority: int) -> Optional[bytes]:
+    audio = await tts_batcher.submit(text, speaker, priority)
+    if audio:
+        audio_cache.put(key, audio)
+    return audio
+
+async def generate_voice(text: str, speaker: str = 'xenia', user=None) -> io.BytesIO:
+    """Generate voice from text"""
+    return await generate_voice_async(text, speaker)
+
+async def generate_voice_async(text: str, speaker: str = 'xenia', user=None) -> io.BytesIO:
+    """Generate voice within the voice backend concurrency limit"""
+    key = audio_key(text, speaker, VOICE_PROSODY)
+    audio = audio_cache.get(key)
+    if audio is None:
+        try:
+            audio = await voice_flights.do(key, lambda: _synthesize_cached(key, text, speaker, priority_for(user)))
+        except QueueTimeout as e:
+            logger.error(f"Voice generation skipped: {e}")
+            return None
+    return io.BytesIO(audio) if audio else None
+
+async def precompute_voices(phrases: list, speakers: list):
+    """Synthesize fixed phrases for every speaker so they become cache hits"""
+    await tts_engine.ready.wait()
+    started = time.monotonic()
+    done = 0
+    for speaker in speakers:
+        for text in phrases:
+            key = audio_key(text, speaker, VOICE_PROSODY)
+            if key in audio_cache:
+                continue
+            # One job at a time: leaves workers free for live traffic
+            audio = await tts_engine.submit(text, speaker)
+            if audio:
+                audio_cache.put(key, audio)
+                done += 1
+    logger.info(
+        f"Precomputed {done} voice phrases for {len(speakers)} speakers in {time.monotonic() - started:.1f}s "
+        f"({audio_cache.size} bytes cached)"
+    )
+
+def generate_voice_sync(text: str, speaker: str = 'xenia', user=None) -> io.BytesIO:
+    """Sync version for background execution"""
+    try:
+        return io.BytesIO(synthesize(text, speaker))
     except Exception as e:
         logger.error(f"Voice generation failed: {e}")
         return None
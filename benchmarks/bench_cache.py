@@ -0,0 +1,75 @@
+"""Compare the sharded in-process cache with the legacy global-lock MemoryCache.
+
+Run from the repository root: python -m benchmarks.bench_cache
+"""
+import asyncio
+import random
+import time
+from typing import Any, Dict, Optional
+from utils.memory_cache import ShardedMemoryCache
+
+class LegacyMemoryCache:
+    """Copy of the MemoryCache that utils/cache.py used before the sharded engine"""
+
+    def __init__(self):
+        self._data: Dict[str, Dict[str, Any]] = {}
+        self._lock = asyncio.Lock()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        async with self._lock:
+            if key in self._data:
+                entry = self._data[key]
+                if time.time() < entry['expire']:
+                    return entry['value']
+                else:
+                    del self._data[key]
+            return None
+
+    async def set(self, key: str, value: bytes, expire: int = 3600):
+        async with self._lock:
+            self._data[key] = {
+                'value': value,
+                'expire': time.time() + expire
+            }
+
+    async def delete(self, key: str):
+        async with self._lock:
+            self._data.pop(key, None)
+
+USERS = 5000
+TASKS = 200
+OPS_PER_TASK = 2000
+HISTORY = b"x" * 4096
+
+async def worker(cache, rng: random.Random):
+    """Chat-like mix: read history, bump rate limit, write history"""
+    for _ in range(OPS_PER_TASK // 4):
+        user = rng.randrange(USERS)
+        await cache.get(f"user:{user}:messages")
+        await cache.get(f"user:{user}:rate_limit")
+        await cache.set(f"user:{user}:rate_limit", b"1", expire=60)
+        await cache.set(f"user:{user}:messages", HISTORY, expire=30 * 24 * 60 * 60)
+
+async def run_mixed(cache) -> float:
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(cache, random.Random(seed)) for seed in range(TASKS)))
+    return TASKS * OPS_PER_TASK / (time.perf_counter() - started)
+
+async def run_expiry(cache) -> int:
+    """Write short-lived keys nobody reads again; returns entries left behind"""
+    for i in range(50000):
+        await cache.set(f"user:{i}:rate_limit", b"1", expire=0.001)
+    await asyncio.sleep(0.01)
+    await cache.set("user:0:messages", HISTORY)
+    if hasattr(cache, "cleanup_expired"):
+        await cache.cleanup_expired()
+    return len(cache._data) if hasattr(cache, "_data") else len(cache)
+
+async def main():
+    for name, factory in (("legacy", LegacyMemoryCache), ("sharded", ShardedMemoryCache)):
+        ops = await run_mixed(factory())
+        left = await run_expiry(factory())
+        print(f"{name:8} {ops:12,.0f} ops/s   expired entries still held: {left}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
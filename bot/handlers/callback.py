@@ -5,12 +5,15 @@ from utils.cache import Cache
 from ai.image_gen import generate_image_async
 from ai.voice_tts import generate_voice
 from bot.keyboards.inline import get_action_keyboard
-import json
+from utils.characters import load_character
+from utils.media_registry import media_registry
 import logging
 
 logger = logging.getLogger(__name__)
 router = Router()
 
+VOICE_GREETING = "Привет, милый! Как дела? 😘"
+
 @router.callback_query(F.data.startswith("char_"))
 async def select_character(callback: CallbackQuery, db: Database):
     """Handle character selection"""
@@ -21,8 +24,7 @@ async def select_character(callback: CallbackQuery, db: Database):
         await db.update_user_character(callback.from_user.id, char_name)
 
         # Load character
-        with open(f"characters/{char_name}.json", "r", encoding="utf-8") as f:
-            character = json.load(f)
+        character = load_character(char_name)
 
         await callback.message.edit_text(
             f"Выбрана {character['name']} {character['age']} лет!\n\n"
@@ -44,15 +46,13 @@ async def send_voice(callback: CallbackQuery, db: Database):
             return
 
         # Load character
-        with open(f"characters/{user.current_character}.json", "r", encoding="utf-8") as f:
-            character = json.load(f)
+        character = load_character(user.current_character)
 
         # Generate voice
-        text = "Привет, милый! Как дела? 😘"
-        voice = await generate_voice(text, character.get('voice', 'xenia'))
+        voice = await generate_voice(VOICE_GREETING, character.get('voice', 'xenia'))
 
         if voice:
-            await callback.message.answer_voice(voice)
+            await media_registry.send_voice(callback.bot, callback.message.chat.id, voice.getvalue())
             await callback.answer("Голос отправлен!")
         else:
             await callback.answer("Ошибка генерации голоса")
@@ -82,7 +82,9 @@ async def send_photo(callback: CallbackQuery, db: Database, cache: Cache):
         image_bytes = await generate_image_async(prompt, "anya_lora", cache, user.is_vip)
 
         if image_bytes:
-            await callback.message.answer_photo(image_bytes, caption="Твоё фото 😘")
+            await media_registry.send_photo(
+                callback.bot, callback.message.chat.id, image_bytes, caption="Твоё фото 😘"
+            )
             await cache.increment_photo_count(callback.from_user.id)
             await callback.answer("Фото отправлено!")
         else:
@@ -1,15 +1,23 @@
 from aiogram import Router, F
 from aiogram.types import Message
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramRetryAfter
 from aiogram.filters import StateFilter
 from bot.states.forms import CharacterForm
 from db.database import Database
-from cache import cache
+from utils.cache import Cache
 from ai.text_llm import TextLLM
 from ai.voice_tts import generate_voice_async
-from ai.image_gen import generate_image_async
-from config.settings import RATE_LIMIT, CHAT_HISTORY_LIMIT
+from ai.image_gen import generate_image_async, finish_image
+from ai.inventory import image_inventory
+from ai.scenes import canonicalize, canonical_key, canonical_prompt
+from ai.limiter import priority_for
+from config.settings import (
+    RATE_LIMIT, CHAT_HISTORY_LIMIT, LLM_STREAMING, STREAM_FIRST_CHARS, STREAM_EDIT_INTERVAL, INVENTORY_ENABLED
+)
 from bot.keyboards.inline import get_action_keyboard
-import json
+from utils.inflight import InFlightTracker
+from utils.characters import load_character
+from utils.media_registry import media_registry
 import asyncio
 import random
 import logging
@@ -20,6 +28,9 @@ router = Router()
 # Rate limiting
 user_last_message = {}
 
+# One running generation per user
+inflight = InFlightTracker()
+
 # Список фраз "ищу фото"
 SEARCH_PHRASES = [
     "ммм, хочешь фотку? щас поищу 😏",
@@ -69,8 +80,7 @@ async def handle_message(
             return
 
         # Load character
-        with open(f"characters/{user.current_character}.json", "r", encoding="utf-8") as f:
-            character = json.load(f)
+        character = load_character(user.current_character)
 
         # Get chat history
         history = await cache.get_chat_history(user_id, CHAT_HISTORY_LIMIT)
@@ -84,24 +94,97 @@ async def handle_message(
             await handle_photo_request(message, user, character, cache, db)
             return
 
-        # Generate response
-        response = await llm.generate_response(text, character, history)
+        # Newer message supersedes the running generation for this user
+        prompt = inflight.submit(user_id, text)
+        await inflight.run(user_id, reply_to_message(message, user, prompt, character, history, cache, llm))
 
-        # Save to history
-        await cache.add_to_chat_history(user_id, text, response)
+    except Exception as e:
+        logger.error(f"Message handling failed: {e}")
+        await message.answer("Извини, что-то пошло не так 😔")
 
-        # Send text response
+async def reply_to_message(message: Message, user, prompt: str, character: dict, history: list,
+                           cache: Cache, llm: TextLLM):
+    """Generate, send and remember reply (cancelled if user sends a newer message)"""
+    user_id = message.from_user.id
+    priority = priority_for(user)
+
+    # Generate and send response
+    if LLM_STREAMING:
+        response = await stream_reply(
+            message, llm.stream_response(prompt, character, history, user_id, cache, priority)
+        )
+    else:
+        response = await llm.generate_response(prompt, character, history, user_id, cache, priority)
         await message.answer(response, reply_markup=get_action_keyboard())
 
-        # Auto voice for short responses
-        if len(response) < 100:
-            voice = await generate_voice_async(response, character.get('voice', 'xenia'))
-            if voice:
-                await message.answer_voice(voice)
+    # Save to history
+    await cache.add_to_chat_history(user_id, prompt, response)
+    inflight.commit(user_id)
+
+    # Auto voice for short responses
+    if len(response) < 100:
+        voice = await generate_voice_async(response, character.get('voice', 'xenia'), user)
+        if voice:
+            await media_registry.send_voice(message.bot, message.chat.id, voice.getvalue())
+
+async def stream_reply(message: Message, chunks) -> str:
+    """Send streamed reply: first message after a few tokens, then throttled edits"""
+    loop = asyncio.get_event_loop()
+    started = loop.time()
+    text = ""
+    shown = ""
+    sent = None
+    last_edit = 0.0
 
-    except Exception as e:
-        logger.error(f"Message handling failed: {e}")
-        await message.answer("Извини, что-то пошло не так 😔")
+    try:
+        try:
+            async for chunk in chunks:
+                text += chunk
+                now = loop.time()
+                if sent is None:
+                    if len(text.strip()) >= STREAM_FIRST_CHARS:
+                        sent = await message.answer(text)
+                        shown = text
+                        last_edit = now
+                        logger.info(f"Reply TTFB for {message.from_user.id}: {now - started:.2f}s")
+                elif now - last_edit >= STREAM_EDIT_INTERVAL and text.strip() != shown.strip():
+                    # In-between edits are best effort: a skipped one is covered by the next
+                    try:
+                        await sent.edit_text(text)
+                        shown = text
+                        last_edit = now
+                    except TelegramRetryAfter as e:
+                        last_edit = now + e.retry_after
+                        logger.warning(f"Stream edit throttled for {message.from_user.id}, backing off {e.retry_after}s")
+                    except TelegramBadRequest as e:
+                        last_edit = now
+                        logger.warning(f"Stream edit skipped for {message.from_user.id}: {e}")
+        finally:
+            # Release upstream connection right away if we got cancelled mid-stream
+            await chunks.aclose()
+
+        text = text.strip() or "Ой, что-то пошло не так... Попробуй ещё раз 💋"
+
+        # Final text goes out together with the action keyboard
+        if sent is None:
+            await message.answer(text, reply_markup=get_action_keyboard())
+        else:
+            try:
+                await sent.edit_text(text, reply_markup=get_action_keyboard())
+            except TelegramRetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+                await sent.edit_text(text, reply_markup=get_action_keyboard())
+    except asyncio.CancelledError:
+        # A newer message supersedes this reply: drop the cut-off text, the merged reply follows
+        if sent is not None:
+            try:
+                await sent.delete()
+            except TelegramAPIError as e:
+                logger.warning(f"Failed to delete superseded reply for {message.from_user.id}: {e}")
+        raise
+
+    logger.info(f"Reply streamed to {message.from_user.id} in {loop.time() - started:.2f}s")
+    return text
 
 @router.message(F.photo)
 async def handle_photo(message: Message, db: Database):
@@ -139,19 +222,29 @@ async def handle_photo_request(message: Message, user, character, cache: Cache,
                 await message.answer("Без VIP только 3 фото в день! /vip")
                 return
 
-        # Immediately respond with search phrase
-        await message.answer(random.choice(SEARCH_PHRASES))
+        # Reduce request to scene and attribute tags so similar wordings share images
+        tags = canonicalize(character, message.text)
+        scene, attributes = tags
 
-        # Generate prompt based on message
-        prompt = f"красивая русская девушка {character['name']} {character['age']} лет, обнажённая, реалистично, {message.text}"
+        # Serve pregenerated image for the scene when stocked
+        image_bytes = None
+        if INVENTORY_ENABLED and not attributes:
+            image_bytes = await image_inventory.take(user.current_character, scene)
+        if image_bytes:
+            image_bytes = await finish_image(image_bytes, user.is_vip, user)
+        else:
+            # Immediately respond with search phrase
+            await message.answer(random.choice(SEARCH_PHRASES))
 
-        # Generate image in background
-        image_path = await generate_image_async(prompt, f"{user.current_character}_lora", cache, user.is_vip, user)
+            # Generate image in background
+            image_bytes = await generate_image_async(
+                canonical_prompt(character, tags), f"{user.current_character}_lora", cache, user.is_vip, user,
+                cache_key=canonical_key(character, tags)
+            )
 
-        if image_path:
+        if image_bytes:
             caption = random.choice(REPLY_PHRASES)
-            with open(image_path, "rb") as photo:
-                await message.answer_photo(photo, caption=caption)
+            await media_registry.send_photo(message.bot, message.chat.id, image_bytes, caption=caption)
 
             # Increment counters
             await cache.increment_photo_count(user_id)
@@ -160,7 +253,7 @@ async def handle_photo_request(message: Message, user, character, cache: Cache,
             if not user.trial_voice_used or user.is_vip:
                 voice = await generate_voice_async(caption, character.get('voice', 'xenia'), user)
                 if voice:
-                    await message.answer_voice(voice)
+                    await media_registry.send_voice(message.bot, message.chat.id, voice.getvalue())
 
             # Update trial status
             if not user.is_vip:
@@ -4,8 +4,7 @@ from aiogram.filters import Command
 from bot.keyboards.inline import get_character_keyboard, get_vip_keyboard
 from db.database import Database
 from utils.cache import Cache
-import json
-import os
+from utils.characters import list_characters
 import logging
 
 logger = logging.getLogger(__name__)
@@ -31,12 +30,7 @@ async def cmd_start(message: Message, db: Database, cache: Cache):
         )
 
         # Get characters
-        characters = []
-        for file in os.listdir("characters"):
-            if file.endswith(".json"):
-                with open(f"characters/{file}", "r", encoding="utf-8") as f:
-                    char = json.load(f)
-                    characters.append(char)
+        characters = list_characters()
 
         await message.answer(
             welcome_text,
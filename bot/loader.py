@@ -4,17 +4,44 @@ from bot.keyboards import inline, reply
 from bot.states import forms
 from bot.filters import vip
 from bot.middlewares.trial import TrialMiddleware
-from utils.scheduler import Scheduler
+from utils.scheduler import Scheduler, MORNING_GREETING, EVENING_GREETING
+from utils.characters import list_characters
+from utils.tempfiles import temp_janitor
+from utils.media_registry import media_registry
+from utils.watermark import watermark_engine
 from db.database import Database
 from utils.cache import Cache
+from utils.cache_backend import MemoryBackend
+from utils.cache_snapshot import CacheSnapshotter
+from utils.image_store import image_store
 from ai.text_llm import TextLLM
-from ai.voice_tts import load_model
-from ai.image_gen import load_pipeline
+from ai.voice_tts import tts_engine, tts_batcher, precompute_voices
+from ai.image_gen import image_service, image_flights, image_cache_stats
+from ai.inventory import image_inventory
+from config.settings import VOICE_PRECOMPUTE, INVENTORY_ENABLED, CACHE_SNAPSHOT
 import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Strong refs to fire-and-forget startup tasks
+background_tasks = set()
+
+def run_in_background(coro):
+    """Start task that lives until shutdown"""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+def fixed_phrases() -> list:
+    """Texts we voice over and over: greetings and photo captions"""
+    return [*message.REPLY_PHRASES, callback.VOICE_GREETING, MORNING_GREETING, EVENING_GREETING]
+
+def voice_speakers() -> list:
+    """Speakers used by characters"""
+    return sorted({character.get('voice', 'xenia') for character in list_characters()})
+
 async def setup_services():
     """Initialize all services"""
     try:
@@ -24,11 +51,41 @@ async def setup_services():
 
         # Initialize cache
         cache = Cache()
+        dp["cache"] = cache
+        run_in_background(cache.sweeper())
+        if CACHE_SNAPSHOT and isinstance(cache.backend, MemoryBackend):
+            # Histories and counters survive restarts of the memory backend
+            snapshots = CacheSnapshotter(cache.backend)
+            await snapshots.restore()
+            dp["cache_snapshots"] = snapshots
+            dp["cache_snapshots_task"] = run_in_background(snapshots.run())
 
         # Initialize AI services
         llm = TextLLM()
-        load_model()  # Load TTS model
-        load_pipeline()  # Load image pipeline
+        await llm.start()
+        dp["llm"] = llm
+        # Voice comes online in background, text is served right away
+        if tts_batcher.engine is not tts_engine:
+            # Otherwise live voice waits forever on an engine that is never started
+            raise RuntimeError("TTS batcher is bound to a different engine than the one being started")
+        run_in_background(tts_engine.start_async(voice_speakers()))
+        if VOICE_PRECOMPUTE:
+            run_in_background(precompute_voices(fixed_phrases(), voice_speakers()))
+        await image_service.start()  # Pooled HTTP/2 clients for images
+        run_in_background(temp_janitor())
+
+        # Cached images: index in memory, blobs on disk
+        await image_store.load()
+        run_in_background(image_store.flusher())
+
+        # Pregenerated images, refilled while the image backend is quiet
+        if INVENTORY_ENABLED:
+            await image_inventory.load()
+            run_in_background(image_inventory.refiller())
+
+        # Telegram file_ids of media we already uploaded
+        await media_registry.load()
+        run_in_background(media_registry.flusher())
 
         # Initialize scheduler
         scheduler = Scheduler()
@@ -69,4 +126,27 @@ async def on_startup():
 
 async def on_shutdown():
     """Shutdown function"""
+    for task in list(background_tasks):
+        task.cancel()
+    llm = dp.get("llm")
+    if llm:
+        logger.info(f"LLM pool at shutdown: {llm.pool_stats()}")
+        await llm.close()
+    await image_service.close()
+    logger.info(f"Image inventory: {image_inventory.metrics()}, single-flight: {image_flights.snapshot()}")
+    logger.info(f"Image post-processing timings: {watermark_engine.metrics()}")
+    watermark_engine.shutdown()
+    cache = dp.get("cache")
+    if cache:
+        logger.info(f"Memory cache: {cache.metrics()}")
+    snapshots = dp.get("cache_snapshots")
+    if snapshots:
+        # A periodic save cancelled above may still be writing: wait for it first
+        await asyncio.gather(dp["cache_snapshots_task"], return_exceptions=True)
+        await snapshots.save()
+        logger.info(f"Cache snapshots: {snapshots.metrics()}")
+    logger.info(f"Image store: {image_store.metrics()}, master hit rate: {image_cache_stats()}")
+    await image_store.save()
+    await media_registry.save()
+    tts_engine.shutdown()
     logger.info("Bot stopped")
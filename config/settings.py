@@ -17,3 +17,122 @@ VOICE_TIMEOUT = 25  # seconds
 IMAGE_TIMEOUT = 25  # seconds
 CHAT_HISTORY_LIMIT = 50  # messages
 WATERMARK_TEXT = "DreamGF.ru"
+
+# OpenRouter HTTP pool
+LLM_POOL_LIMIT = int(os.getenv('LLM_POOL_LIMIT', 100))  # total connections
+LLM_POOL_LIMIT_PER_HOST = int(os.getenv('LLM_POOL_LIMIT_PER_HOST', 32))
+LLM_KEEPALIVE_TIMEOUT = int(os.getenv('LLM_KEEPALIVE_TIMEOUT', 60))  # seconds
+LLM_TIMEOUT = 25  # seconds, whole non-streamed completion
+LLM_CONNECT_TIMEOUT = 10  # seconds
+LLM_STREAM_READ_TIMEOUT = 30  # seconds of silence allowed between stream chunks
+
+# Streaming replies
+LLM_STREAMING = os.getenv('LLM_STREAMING', '1') == '1'
+STREAM_FIRST_CHARS = 24  # chars before the first message is sent
+STREAM_EDIT_INTERVAL = 1.2  # seconds between edits, Telegram allows ~1 edit/s per chat
+
+# Prompt assembly
+PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', 1500))  # tokens of verbatim history
+SUMMARY_TOKEN_BUDGET = int(os.getenv('SUMMARY_TOKEN_BUDGET', 300))  # tokens of folded older turns
+SUMMARY_LINE_CHARS = 120  # chars kept per side of a folded turn
+
+# Burst handling
+COALESCE_MESSAGES = os.getenv('COALESCE_MESSAGES', '1') == '1'  # answer queued messages in one prompt
+
+# Upstream concurrency (adaptive per backend, seconds for latency/deadline)
+UPSTREAM_LIMITS = {
+    'text': {'initial': int(os.getenv('TEXT_CONCURRENCY', 16)), 'min_limit': 2, 'max_limit': 64,
+             'target_latency': 10.0, 'queue_deadline': 15.0},
+    'image': {'initial': int(os.getenv('IMAGE_CONCURRENCY', 4)), 'min_limit': 1, 'max_limit': 16,
+              'target_latency': 20.0, 'queue_deadline': 30.0},
+    'voice': {'initial': int(os.getenv('VOICE_CONCURRENCY', 2)), 'min_limit': 1, 'max_limit': 8,
+              'target_latency': 6.0, 'queue_deadline': 15.0},
+}
+
+# Model routing (first model is primary, the rest are hedged fallbacks)
+LLM_MODELS = os.getenv(
+    'LLM_MODELS', 'deepseek/deepseek-r1-abliterated,nousresearch/hermes-3-llama-3.1-70b'
+).split(',')
+LLM_HEDGE_DELAY = 8.0  # seconds before hedging until the primary has a measured p95
+LLM_STATS_WINDOW = 200  # requests per model kept for latency/error stats
+LLM_MAX_ERROR_RATE = 0.5  # models failing more often are tried last
+
+# TTS worker processes
+TTS_WORKERS = int(os.getenv('TTS_WORKERS', 1))
+TTS_THREADS_PER_WORKER = int(os.getenv('TTS_THREADS_PER_WORKER', 2))  # torch intra-op threads
+TTS_MODEL_PATH = os.getenv('TTS_MODEL_PATH', 'models/silero_v5_ru.pt')  # pinned local model package
+TTS_OFFLINE = os.getenv('TTS_OFFLINE', '0') == '1'  # never fall back to torch.hub download
+TTS_LOAD_TIMEOUT = 300  # seconds for worker start + model load + first synthesis
+TTS_BATCH_WINDOW = float(os.getenv('TTS_BATCH_WINDOW', 0.03))  # seconds to gather jobs per speaker
+TTS_MAX_BATCH = 8
+TTS_BATCH_MAX_CHARS = 100  # only short texts are batched
+
+# Voice encoding
+VOICE_SAMPLE_RATE = 24000
+VOICE_BITRATE = int(os.getenv('VOICE_BITRATE', 32000))  # Opus bits per second
+TTS_SEGMENT_CHARS = 250  # longer texts are synthesized and encoded sentence by sentence
+VOICE_CACHE_BYTES = int(os.getenv('VOICE_CACHE_BYTES', 32 * 1024 * 1024))  # encoded audio kept in memory
+VOICE_PRECOMPUTE = os.getenv('VOICE_PRECOMPUTE', '1') == '1'  # synthesize fixed phrases at startup
+
+# Image HTTP clients
+IMAGE_CONNECT_TIMEOUT = 5  # seconds
+IMAGE_DOWNLOAD_TIMEOUT = int(os.getenv('IMAGE_DOWNLOAD_TIMEOUT', 15))  # seconds
+IMAGE_API_MAX_CONNECTIONS = int(os.getenv('IMAGE_API_MAX_CONNECTIONS', 16))
+IMAGE_CDN_MAX_CONNECTIONS = int(os.getenv('IMAGE_CDN_MAX_CONNECTIONS', 16))
+IMAGE_KEEPALIVE_EXPIRY = 60  # seconds
+
+# Photo uploads
+IMAGE_SPILL_BYTES = int(os.getenv('IMAGE_SPILL_BYTES', 0))  # spill uploads above this size to temp/, 0 = never
+TEMP_DIR = "temp"
+TEMP_MAX_BYTES = int(os.getenv('TEMP_MAX_BYTES', 256 * 1024 * 1024))
+TEMP_FILE_TTL = 15 * 60  # seconds a spilled file may live
+TEMP_JANITOR_INTERVAL = 60  # seconds
+
+# Telegram file_id registry
+MEDIA_REGISTRY_PATH = os.getenv('MEDIA_REGISTRY_PATH', 'data/media_registry.json')
+MEDIA_REGISTRY_MAX = 100000  # entries, oldest forgotten first
+MEDIA_REGISTRY_FLUSH_INTERVAL = 30  # seconds
+
+# Image post-processing
+WATERMARK_TRIAL_TEXT = "DreamGF.ru — VIP 990₽"
+WATERMARK_FONT_PATH = os.getenv('WATERMARK_FONT_PATH', 'arial.ttf')
+WATERMARK_FONT_SIZE = 20
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))  # threads for decode/composite/encode
+JPEG_QUALITY = 90
+
+# Pregenerated image inventory per (character, scene)
+INVENTORY_ENABLED = os.getenv('INVENTORY_ENABLED', '1') == '1'
+INVENTORY_DIR = 'data/inventory'
+INVENTORY_LOW_WATER = int(os.getenv('INVENTORY_LOW_WATER', 1))  # refill below this
+INVENTORY_HIGH_WATER = int(os.getenv('INVENTORY_HIGH_WATER', 3))  # refill up to this
+INVENTORY_REFILL_INTERVAL = float(os.getenv('INVENTORY_REFILL_INTERVAL', 30))  # seconds between refills
+INVENTORY_IDLE_ACTIVE = int(os.getenv('INVENTORY_IDLE_ACTIVE', 1))  # refill only when image backend is this quiet
+
+# Image cache: hot LRU in memory over a content-addressed store on disk
+IMAGE_STORE_DIR = 'data/images'
+IMAGE_HOT_BYTES = int(os.getenv('IMAGE_HOT_BYTES', 32 * 1024 * 1024))
+IMAGE_DISK_BYTES = int(os.getenv('IMAGE_DISK_BYTES', 1024 * 1024 * 1024))
+IMAGE_CACHE_TTL = 24 * 60 * 60
+IMAGE_EVICTION = os.getenv('IMAGE_EVICTION', 'lru')  # lru or lfu
+IMAGE_STORE_FLUSH_INTERVAL = 60
+
+# Photo requests are reduced to a scene plus at most this many attribute tags
+MAX_PROMPT_ATTRIBUTES = 2
+
+# In-process cache used with REDIS_URL=memory://
+CACHE_SHARDS = 16
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 200000))
+CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', 128 * 1024 * 1024))
+CACHE_SWEEP_INTERVAL = 30
+CACHE_TTLS = {  # default TTL per key namespace, seconds
+    'messages': 30 * 24 * 60 * 60,
+    'summary': 30 * 24 * 60 * 60,
+    'image': 24 * 60 * 60,
+    'rate_limit': 60,
+    'photo_count': 24 * 60 * 60,
+}
+
+# Snapshots of the in-process cache, so restarts keep histories and counters
+CACHE_SNAPSHOT = os.getenv('CACHE_SNAPSHOT', '1') == '1'
+CACHE_SNAPSHOT_DIR = 'data/cache'
+CACHE_SNAPSHOT_INTERVAL = int(os.getenv('CACHE_SNAPSHOT_INTERVAL', 60))
@@ -1,80 +1,37 @@
 import json
 import hashlib
-import asyncio
-import time
-from typing import Dict, Any, Optional
+from typing import Optional
 from config.settings import REDIS_URL, CHAT_HISTORY_LIMIT
+from utils.image_store import ImageStore, image_store
+from utils.cache_backend import CacheBackend, MemoryBackend, RedisBackend
 import logging
 
 logger = logging.getLogger(__name__)
 
-class MemoryCache:
-    """In-memory cache with TTL support"""
-
-    def __init__(self):
-        self._data: Dict[str, Dict[str, Any]] = {}
-        self._lock = asyncio.Lock()
-
-    async def get(self, key: str) -> Optional[bytes]:
-        """Get value from cache"""
-        async with self._lock:
-            if key in self._data:
-                entry = self._data[key]
-                if time.time() < entry['expire']:
-                    return entry['value']
-                else:
-                    del self._data[key]
-            return None
-
-    async def set(self, key: str, value: bytes, expire: int = 3600):
-        """Set value in cache with TTL"""
-        async with self._lock:
-            self._data[key] = {
-                'value': value,
-                'expire': time.time() + expire
-            }
-
-    async def delete(self, key: str):
-        """Delete key from cache"""
-        async with self._lock:
-            self._data.pop(key, None)
-
-    async def cleanup_expired(self):
-        """Remove expired entries"""
-        async with self._lock:
-            current_time = time.time()
-            expired_keys = [k for k, v in self._data.items() if current_time >= v['expire']]
-            for key in expired_keys:
-                del self._data[key]
+def make_backend(redis_url: str = REDIS_URL) -> CacheBackend:
+    """Memory backend for memory:// (or without redis installed), Redis otherwise"""
+    if redis_url == "memory://" or not redis_url:
+        return MemoryBackend()
+    try:
+        return RedisBackend.from_url(redis_url)
+    except ImportError:
+        logger.warning("Redis not available, using memory cache")
+        return MemoryBackend()
 
 class Cache:
-    def __init__(self, redis_url: str = REDIS_URL):
-        if redis_url == "memory://" or not redis_url:
-            self._backend = MemoryCache()
-            self._is_memory = True
-        else:
-            try:
-                import redis.asyncio as redis
-                self._backend = redis.from_url(redis_url)
-                self._is_memory = False
-            except ImportError:
-                logger.warning("Redis not available, using memory cache")
-                self._backend = MemoryCache()
-                self._is_memory = True
-
-    async def get_chat_history(self, user_id: int) -> list:
-        """Get chat history for user"""
+    def __init__(self, redis_url: str = REDIS_URL, images: ImageStore = image_store, backend: CacheBackend = None):
+        # Images live in their own size-bounded store, not in the key-value backend
+        self.images = images
+        self._backend = backend if backend is not None else make_backend(redis_url)
+
+    @property
+    def backend(self) -> CacheBackend:
+        return self._backend
+
+    async def get_chat_history(self, user_id: int, limit: int = CHAT_HISTORY_LIMIT) -> list:
+        """Get chat history for user, oldest turn first"""
         try:
-            if self._is_memory:
-                key = f"user:{user_id}:messages"
-                data = await self._backend.get(key)
-                if data:
-                    messages = json.loads(data.decode())
-                    return messages[-CHAT_HISTORY_LIMIT:]
-                return []
-            else:
-                messages = await self._backend.lrange(key, 0, CHAT_HISTORY_LIMIT - 1)
-                return [json.loads(msg) for msg in messages]
+            return await self._backend.last_turns(f"user:{user_id}:messages", limit)
         except Exception as e:
             logger.error(f"Failed to get chat history for {user_id}: {e}")
             return []
@@ -82,18 +39,7 @@ class Cache:
     async def add_message(self, user_id: int, message: str, response: str):
         """Add message pair to chat history"""
         try:
-            if self._is_memory:
-                key = f"user:{user_id}:messages"
-                current = await self.get_chat_history(user_id)
-                current.append({"user": message, "assistant": response})
-                data = json.dumps(current[-CHAT_HISTORY_LIMIT:]).encode()
-                await self._backend.set(key, data, expire=30 * 24 * 60 * 60)
-            else:
-                key = f"user:{user_id}:messages"
-                data = json.dumps({"user": message, "assistant": response})
-                await self._backend.lpush(key, data)
-                await self._backend.ltrim(key, 0, CHAT_HISTORY_LIMIT - 1)
-                await self._backend.expire(key, 30 * 24 * 60 * 60)
+            await self._backend.append_turn(f"user:{user_id}:messages", message, response, CHAT_HISTORY_LIMIT)
         except Exception as e:
             logger.error(f"Failed to add message for {user_id}: {e}")
 
@@ -101,14 +47,28 @@ class Cache:
         """Alias for add_message"""
         await self.add_message(user_id, message, response)
 
+    async def get_history_summary(self, user_id: int) -> Optional[dict]:
+        """Get rolling summary of older chat turns"""
+        try:
+            data = await self._backend.get(f"user:{user_id}:summary")
+            return json.loads(data) if data else None
+        except Exception as e:
+            logger.error(f"Failed to get history summary for {user_id}: {e}")
+            return None
+
+    async def set_history_summary(self, user_id: int, summary: dict):
+        """Store rolling summary next to chat history"""
+        try:
+            data = json.dumps(summary, ensure_ascii=False).encode()
+            await self._backend.set(f"user:{user_id}:summary", data)
+        except Exception as e:
+            logger.error(f"Failed to set history summary for {user_id}: {e}")
+
     async def get_image_cache(self, user_id: int, prompt_hash: str) -> bytes:
         """Get cached image"""
         try:
             key = f"user:{user_id}:image:{prompt_hash}"
-            if self._is_memory:
-                return await self._backend.get(key)
-            else:
-                return await self._backend.get(key)
+            return await self.images.get(key)
         except Exception as e:
             logger.error(f"Failed to get cached image for {user_id}: {e}")
             return None
@@ -117,23 +77,33 @@ class Cache:
         """Cache image data"""
         try:
             key = f"user:{user_id}:image:{prompt_hash}"
-            if self._is_memory:
-                await self._backend.set(key, image_data, expire=24 * 60 * 60)
-            else:
-                await self._backend.set(key, image_data, ex=24 * 60 * 60)
+            await self.images.put(key, image_data)
         except Exception as e:
             logger.error(f"Failed to cache image for {user_id}: {e}")
 
+    async def get_image_variant(self, master_hash: str, spec: str) -> bytes:
+        """Get cached variant of master image"""
+        try:
+            return await self.images.get(f"image:variant:{master_hash}:{spec}")
+        except Exception as e:
+            logger.error(f"Failed to get image variant {spec}: {e}")
+            return None
+
+    async def set_image_variant(self, master_hash: str, spec: str, image_data: bytes):
+        """Cache variant of master image"""
+        try:
+            await self.images.put(f"image:variant:{master_hash}:{spec}", image_data)
+        except Exception as e:
+            logger.error(f"Failed to cache image variant {spec}: {e}")
+
+    async def _get_count(self, key: str) -> int:
+        data = await self._backend.get(key)
+        return int(data) if data else 0
+
     async def get_user_rate_limit(self, user_id: int) -> int:
         """Get current message count for rate limiting"""
         try:
-            key = f"user:{user_id}:rate_limit"
-            if self._is_memory:
-                data = await self._backend.get(key)
-                return int(data.decode()) if data else 0
-            else:
-                count = await self._backend.get(key)
-                return int(count) if count else 0
+            return await self._get_count(f"user:{user_id}:rate_limit")
         except Exception as e:
             logger.error(f"Failed to get rate limit for {user_id}: {e}")
             return 0
@@ -141,26 +111,14 @@ class Cache:
     async def increment_rate_limit(self, user_id: int):
         """Increment message count for rate limiting"""
         try:
-            key = f"user:{user_id}:rate_limit"
-            if self._is_memory:
-                current = await self.get_user_rate_limit(user_id)
-                await self._backend.set(key, str(current + 1).encode(), expire=60)
-            else:
-                await self._backend.incr(key)
-                await self._backend.expire(key, 60)
+            await self._backend.incr(f"user:{user_id}:rate_limit")
         except Exception as e:
             logger.error(f"Failed to increment rate limit for {user_id}: {e}")
 
     async def get_user_photo_count(self, user_id: int) -> int:
         """Get current photo count for user"""
         try:
-            key = f"user:{user_id}:photo_count"
-            if self._is_memory:
-                data = await self._backend.get(key)
-                return int(data.decode()) if data else 0
-            else:
-                count = await self._backend.get(key)
-                return int(count) if count else 0
+            return await self._get_count(f"user:{user_id}:photo_count")
         except Exception as e:
             logger.error(f"Failed to get photo count for {user_id}: {e}")
             return 0
@@ -168,20 +126,20 @@ class Cache:
     async def increment_photo_count(self, user_id: int):
         """Increment photo count for user"""
         try:
-            key = f"user:{user_id}:photo_count"
-            if self._is_memory:
-                current = await self.get_user_photo_count(user_id)
-                await self._backend.set(key, str(current + 1).encode(), expire=24 * 60 * 60)
-            else:
-                await self._backend.incr(key)
-                await self._backend.expire(key, 24 * 60 * 60)
+            await self._backend.incr(f"user:{user_id}:photo_count")
         except Exception as e:
             logger.error(f"Failed to increment photo count for {user_id}: {e}")
 
+    async def sweeper(self):
+        """Expire idle entries of the in-process backend"""
+        await self._backend.sweeper()
+
+    def metrics(self) -> dict:
+        return self._backend.metrics()
+
     async def close(self):
-        """Close connection if Redis"""
-        if not self._is_memory:
-            await self._backend.close()
+        """Close backend connection"""
+        await self._backend.close()
 
 def get_prompt_hash(prompt: str, character: str) -> str:
     """Generate hash for prompt + character"""
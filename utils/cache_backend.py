@@ -0,0 +1,107 @@
+import json
+from typing import Optional, Protocol
+from utils.history import HistoryRing
+from utils.memory_cache import ShardedMemoryCache, ttl_for
+import logging
+
+logger = logging.getLogger(__name__)
+
+class CacheBackend(Protocol):
+    """Key-value operations Cache needs; compound ones are a single round trip"""
+
+    async def get(self, key: str) -> Optional[bytes]: ...
+
+    async def set(self, key: str, value: bytes, expire: int = None): ...
+
+    async def delete(self, key: str): ...
+
+    async def incr(self, key: str, expire: int = None) -> int:
+        """Increment counter and (re)set its TTL"""
+
+    async def append_turn(self, key: str, user: str, assistant: str, maxlen: int, expire: int = None):
+        """Append chat turn, keep newest maxlen turns, (re)set TTL"""
+
+    async def last_turns(self, key: str, limit: int) -> list:
+        """Newest `limit` turns, oldest first, as message dicts"""
+
+    async def sweeper(self): ...
+
+    def metrics(self) -> dict: ...
+
+    async def close(self): ...
+
+class MemoryBackend(ShardedMemoryCache):
+    """In-process backend; history turns stay native HistoryRing objects"""
+
+    async def incr(self, key: str, expire: int = None) -> int:
+        data = self.get_nowait(key)
+        value = (int(data) if data else 0) + 1
+        self.set_nowait(key, str(value).encode(), expire)
+        return value
+
+    async def append_turn(self, key: str, user: str, assistant: str, maxlen: int, expire: int = None):
+        ring = self.get_nowait(key)
+        if ring is None or ring.turns.maxlen != maxlen:
+            ring = HistoryRing(ring.turns if ring else (), maxlen=maxlen)
+        ring.append(user, assistant)
+        # set() refreshes TTL, recency and size
+        self.set_nowait(key, ring, expire)
+
+    async def last_turns(self, key: str, limit: int) -> list:
+        ring = self.get_nowait(key)
+        return ring.last(limit) if ring else []
+
+    async def close(self):
+        for shard in self._shards:
+            shard.data.clear()
+            shard.heap.clear()
+            shard.size = 0
+
+class RedisBackend:
+    """Redis backend; takes any redis.asyncio-compatible client (e.g. fakeredis)"""
+
+    def __init__(self, client):
+        self.client = client
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisBackend":
+        import redis.asyncio as redis
+        return cls(redis.from_url(url))
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(key)
+
+    async def set(self, key: str, value: bytes, expire: int = None):
+        await self.client.set(key, value, ex=expire or ttl_for(key))
+
+    async def delete(self, key: str):
+        await self.client.delete(key)
+
+    async def incr(self, key: str, expire: int = None) -> int:
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.incr(key)
+            pipe.expire(key, expire or ttl_for(key))
+            value, _ = await pipe.execute()
+        return value
+
+    async def append_turn(self, key: str, user: str, assistant: str, maxlen: int, expire: int = None):
+        # Newest first, as the list has always been stored
+        data = json.dumps({"user": user, "assistant": assistant})
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.lpush(key, data)
+            pipe.ltrim(key, 0, maxlen - 1)
+            pipe.expire(key, expire or ttl_for(key))
+            await pipe.execute()
+
+    async def last_turns(self, key: str, limit: int) -> list:
+        messages = await self.client.lrange(key, 0, limit - 1)
+        return [json.loads(message) for message in reversed(messages)]
+
+    async def sweeper(self):
+        """Redis expires keys itself"""
+
+    def metrics(self) -> dict:
+        return {}
+
+    async def close(self):
+        await self.client.close()
@@ -0,0 +1,152 @@
+import asyncio
+import os
+import pickle
+import time
+import zlib
+from config.settings import CACHE_SNAPSHOT_DIR, CACHE_SNAPSHOT_INTERVAL
+from utils.history import HistoryRing
+from utils.memory_cache import ShardedMemoryCache
+import logging
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+def _freeze(value):
+    """Immutable copy of value, taken on the event loop"""
+    if isinstance(value, HistoryRing):
+        return ("h", value.turns.maxlen, tuple(value.turns))
+    return ("v", value)
+
+def _thaw(frozen):
+    if frozen[0] == "h":
+        return HistoryRing(frozen[2], maxlen=frozen[1])
+    return frozen[1]
+
+class CacheSnapshotter:
+    """Periodic snapshots of the in-process cache: one file per shard, only changed shards rewritten"""
+
+    def __init__(self, cache: ShardedMemoryCache, root: str = CACHE_SNAPSHOT_DIR):
+        self.cache = cache
+        self.root = root
+        self.stats = {"snapshots": 0, "shards_written": 0, "bytes": 0, "last_ms": 0.0, "restored": 0, "restore_ms": 0.0}
+
+    def _path(self, index: int) -> str:
+        return os.path.join(self.root, f"shard-{index:02d}.snap")
+
+    def _write(self, index: int, records: list) -> int:
+        # Wall-clock deadlines so remaining TTLs survive the restart
+        data = zlib.compress(pickle.dumps((SNAPSHOT_VERSION, len(self.cache._shards), records)), 1)
+        os.makedirs(self.root, exist_ok=True)
+        path = self._path(index)
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(data)
+        os.replace(f"{path}.tmp", path)
+        return len(data)
+
+    def _read_all(self) -> list:
+        records = []
+        if not os.path.isdir(self.root):
+            return records
+        for name in sorted(os.listdir(self.root)):
+            if not name.endswith(".snap"):
+                continue
+            try:
+                with open(os.path.join(self.root, name), "rb") as f:
+                    version, _, shard_records = pickle.loads(zlib.decompress(f.read()))
+                if version == SNAPSHOT_VERSION:
+                    records.extend(shard_records)
+            except Exception as e:
+                logger.warning(f"Skipping unreadable cache snapshot {name}: {e}")
+        return records
+
+    def _prune(self) -> int:
+        """Remove files of shards that no longer exist, returns bytes on disk"""
+        total = 0
+        for name in os.listdir(self.root) if os.path.isdir(self.root) else ():
+            path = os.path.join(self.root, name)
+            if not name.endswith(".snap"):
+                continue
+            if int(name[6:-5]) >= len(self.cache._shards):
+                os.remove(path)
+            else:
+                total += os.path.getsize(path)
+        return total
+
+    async def restore(self):
+        """Load snapshot files, keeping only entries with TTL left"""
+        started = time.perf_counter()
+        try:
+            records = await asyncio.to_thread(self._read_all)
+        except Exception as e:
+            logger.error(f"Failed to restore cache snapshot: {e}")
+            return
+
+        now = time.time()
+        restored = 0
+        for key, frozen, expire in records:
+            if expire > now:
+                self.cache.set_nowait(key, _thaw(frozen), expire - now)
+                restored += 1
+        # Rewrite every shard on the next snapshot; files of removed shards are pruned after it
+        for shard in self.cache._shards:
+            shard.dirty = True
+        self.stats["restored"] = restored
+        self.stats["restore_ms"] = round(1000 * (time.perf_counter() - started), 1)
+        logger.info(f"Cache restored: {restored} of {len(records)} entries in {self.stats['restore_ms']}ms")
+
+    async def save(self):
+        """Write changed shards; copying happens on the loop, encoding and I/O in a thread"""
+        started = time.perf_counter()
+        await self.cache.cleanup_expired()
+        changed = []
+        for index, shard in enumerate(self.cache._shards):
+            if shard.dirty:
+                shard.dirty = False
+                changed.append((index, [(key, _freeze(entry.value), entry.expire) for key, entry in shard.data.items()]))
+        if not changed:
+            return
+
+        written = 0
+        unwritten = {index for index, _ in changed}
+        try:
+            for index, records in changed:
+                write = asyncio.ensure_future(asyncio.to_thread(self._write, index, records))
+                try:
+                    written += await asyncio.shield(write)
+                    unwritten.discard(index)
+                except asyncio.CancelledError:
+                    # The thread keeps going: let it finish so no later save races its .tmp file
+                    try:
+                        await write
+                        unwritten.discard(index)
+                    except Exception:
+                        pass
+                    raise
+                except Exception as e:
+                    logger.error(f"Failed to snapshot cache shard {index}: {e}")
+        finally:
+            # Shards that did not reach disk are picked up by the next save
+            for index in unwritten:
+                self.cache._shards[index].dirty = True
+
+        self.stats["snapshots"] += 1
+        self.stats["shards_written"] += len(changed)
+        self.stats["bytes"] = await asyncio.to_thread(self._prune)
+        self.stats["last_ms"] = round(1000 * (time.perf_counter() - started), 1)
+        logger.info(
+            f"Cache snapshot: {len(changed)} shards, {written} bytes written, "
+            f"{self.stats['bytes']} bytes total in {self.stats['last_ms']}ms"
+        )
+
+    async def run(self, interval: float = CACHE_SNAPSHOT_INTERVAL):
+        """Snapshot periodically"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.save()
+            except Exception as e:
+                logger.error(f"Cache snapshot failed: {e}")
+
+    def metrics(self) -> dict:
+        return dict(self.stats)
@@ -0,0 +1,31 @@
+import json
+import os
+from typing import Dict, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHARACTERS_DIR = "characters"
+
+# name -> (file mtime, parsed character)
+_characters: Dict[str, Tuple[int, dict]] = {}
+
+def load_character(name: str) -> dict:
+    """Load character JSON, re-reading the file only when it changes"""
+    path = os.path.join(CHARACTERS_DIR, f"{name}.json")
+    mtime = os.stat(path).st_mtime_ns
+    cached = _characters.get(name)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with open(path, "r", encoding="utf-8") as f:
+        character = json.load(f)
+    character.setdefault("file", name)
+    _characters[name] = (mtime, character)
+    logger.info(f"Character loaded: {name}")
+    return character
+
+def list_characters() -> list:
+    """Load all characters"""
+    names = sorted(file[:-5] for file in os.listdir(CHARACTERS_DIR) if file.endswith(".json"))
+    return [load_character(name) for name in names]
@@ -0,0 +1,33 @@
+from collections import deque
+from itertools import islice
+from typing import Iterable, Tuple
+from config.settings import CHAT_HISTORY_LIMIT
+
+Turn = Tuple[str, str]  # (user message, assistant reply)
+
+class HistoryRing:
+    """Bounded per-user chat history kept as native turn tuples"""
+
+    __slots__ = ("turns", "nbytes")
+
+    def __init__(self, turns: Iterable[Turn] = (), maxlen: int = CHAT_HISTORY_LIMIT):
+        self.turns = deque(maxlen=maxlen)
+        self.nbytes = 0  # approximate size, read by the cache byte budget
+        for user, assistant in turns:
+            self.append(user, assistant)
+
+    def __len__(self) -> int:
+        return len(self.turns)
+
+    def append(self, user: str, assistant: str):
+        """Add turn in O(1), dropping the oldest when full"""
+        if len(self.turns) == self.turns.maxlen:
+            old_user, old_assistant = self.turns[0]
+            self.nbytes -= len(old_user) + len(old_assistant)
+        self.turns.append((user, assistant))
+        self.nbytes += len(user) + len(assistant)
+
+    def last(self, limit: int) -> list:
+        """Newest `limit` turns, oldest first, as message dicts"""
+        start = max(0, len(self.turns) - limit)
+        return [{"user": user, "assistant": assistant} for user, assistant in islice(self.turns, start, None)]
@@ -0,0 +1,246 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, Optional
+from config.settings import (
+    IMAGE_STORE_DIR, IMAGE_HOT_BYTES, IMAGE_DISK_BYTES, IMAGE_CACHE_TTL, IMAGE_EVICTION, IMAGE_STORE_FLUSH_INTERVAL
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Index entry fields
+DIGEST, SIZE, EXPIRE, ACCESSED, HITS = range(5)
+
+class ImageStore:
+    """Hot in-memory LRU over a byte-budgeted, content-addressed image store on disk"""
+
+    def __init__(self, root: str = IMAGE_STORE_DIR, hot_bytes: int = IMAGE_HOT_BYTES,
+                 disk_bytes: int = IMAGE_DISK_BYTES, ttl: int = IMAGE_CACHE_TTL, policy: str = IMAGE_EVICTION):
+        self.root = root
+        self.index_path = os.path.join(root, "index.json")
+        self.hot_bytes = hot_bytes
+        self.disk_bytes = disk_bytes
+        self.ttl = ttl
+        self.policy = policy
+        self._hot: "OrderedDict[str, bytes]" = OrderedDict()
+        self.hot_size = 0
+        self._index: Dict[str, list] = {}  # key -> [digest, size, expire, accessed, hits]
+        self._refs = Counter()  # digest -> keys pointing at blob
+        self.disk_size = 0
+        self._dirty = False
+        self._loaded_at = time.time()
+        self.stats = {"hot_hits": 0, "disk_hits": 0, "misses": 0, "hot_evictions": 0, "disk_evictions": 0, "writes": 0}
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, "blobs", digest[:2], digest)
+
+    def _read_blob(self, digest: str) -> bytes:
+        with open(self._blob_path(digest), "rb") as f:
+            return f.read()
+
+    def _write_blob(self, digest: str, data: bytes):
+        path = self._blob_path(digest)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(data)
+        os.replace(f"{path}.tmp", path)
+
+    def _remove_blobs(self, digests: list):
+        for digest in digests:
+            try:
+                os.remove(self._blob_path(digest))
+            except FileNotFoundError:
+                pass
+
+    def _put_hot(self, key: str, data: bytes):
+        if len(data) > self.hot_bytes:
+            return
+        if key in self._hot:
+            self.hot_size -= len(self._hot.pop(key))
+        self._hot[key] = data
+        self.hot_size += len(data)
+        while self.hot_size > self.hot_bytes:
+            _, evicted = self._hot.popitem(last=False)
+            self.hot_size -= len(evicted)
+            self.stats["hot_evictions"] += 1
+
+    def _drop(self, key: str) -> Optional[str]:
+        """Forget key; returns digest of blob nothing points at anymore"""
+        data = self._hot.pop(key, None)
+        if data is not None:
+            self.hot_size -= len(data)
+        entry = self._index.pop(key, None)
+        if entry is None:
+            return None
+        self._dirty = True
+        digest = entry[DIGEST]
+        self._refs[digest] -= 1
+        if self._refs[digest] > 0:
+            return None
+        del self._refs[digest]
+        self.disk_size -= entry[SIZE]
+        return digest
+
+    def _evict(self) -> list:
+        """Drop expired keys, then least recently/frequently used down to 90% of budget"""
+        now = time.time()
+        orphans = [self._drop(key) for key, entry in list(self._index.items()) if entry[EXPIRE] <= now]
+        if self.disk_size > self.disk_bytes:
+            if self.policy == "lfu":
+                rank = lambda item: (item[1][HITS], item[1][ACCESSED])
+            else:
+                rank = lambda item: item[1][ACCESSED]
+            for key, _ in sorted(self._index.items(), key=rank):
+                if self.disk_size <= 0.9 * self.disk_bytes:
+                    break
+                orphan = self._drop(key)
+                if orphan:
+                    self.stats["disk_evictions"] += 1
+                    orphans.append(orphan)
+        return [digest for digest in orphans if digest]
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """Image bytes for key from memory or disk"""
+        entry = self._index.get(key)
+        if entry is None or entry[EXPIRE] <= time.time():
+            if entry is not None:
+                orphan = self._drop(key)
+                if orphan:
+                    await asyncio.to_thread(self._remove_blobs, [orphan])
+            self.stats["misses"] += 1
+            return None
+
+        entry[ACCESSED] = time.time()
+        entry[HITS] += 1
+        self._dirty = True
+        data = self._hot.get(key)
+        if data is not None:
+            self._hot.move_to_end(key)
+            self.stats["hot_hits"] += 1
+            return data
+
+        try:
+            data = await asyncio.to_thread(self._read_blob, entry[DIGEST])
+        except FileNotFoundError:
+            self._drop(key)
+            self.stats["misses"] += 1
+            return None
+        self._put_hot(key, data)
+        self.stats["disk_hits"] += 1
+        return data
+
+    async def put(self, key: str, data: bytes, ttl: int = None):
+        """Store image under key; identical bytes share one blob"""
+        digest = hashlib.sha256(data).hexdigest()
+        expire = time.time() + (ttl or self.ttl)
+        self._put_hot(key, data)
+
+        entry = self._index.get(key)
+        if entry is not None and entry[DIGEST] == digest:
+            entry[EXPIRE] = expire
+            self._dirty = True
+            return
+
+        orphans = [self._drop(key)] if entry is not None else []
+        new_blob = digest not in self._refs
+        # Account before writing so concurrent puts of the same bytes see the blob
+        self._refs[digest] += 1
+        self._index[key] = [digest, len(data), expire, time.time(), 0]
+        self._dirty = True
+        if new_blob:
+            self.disk_size += len(data)
+            self.stats["writes"] += 1
+            await asyncio.to_thread(self._write_blob, digest, data)
+        orphans.extend(self._evict())
+
+        orphans = [digest for digest in orphans if digest and digest not in self._refs]
+        if orphans:
+            await asyncio.to_thread(self._remove_blobs, orphans)
+
+    def _read_index(self) -> dict:
+        with open(self.index_path, "r") as f:
+            return json.load(f)
+
+    def _write_index(self, index: dict):
+        os.makedirs(self.root, exist_ok=True)
+        with open(f"{self.index_path}.tmp", "w") as f:
+            json.dump(index, f, separators=(",", ":"))
+        os.replace(f"{self.index_path}.tmp", self.index_path)
+
+    def _sweep(self, known: set) -> int:
+        """Delete blobs the index does not know, e.g. written before a crash"""
+        removed = 0
+        blobs = os.path.join(self.root, "blobs")
+        if not os.path.isdir(blobs):
+            return removed
+        for folder in os.scandir(blobs):
+            for blob in os.scandir(folder.path):
+                if blob.name not in known and blob.stat().st_mtime < self._loaded_at:
+                    os.remove(blob.path)
+                    removed += 1
+        return removed
+
+    async def load(self):
+        """Load index from one JSON file; blobs are read on demand"""
+        self._loaded_at = time.time()
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            index = await asyncio.to_thread(self._read_index)
+        except Exception as e:
+            logger.error(f"Failed to load image store index: {e}")
+            return
+
+        now = time.time()
+        for key, entry in index.items():
+            if entry[EXPIRE] <= now:
+                continue
+            self._index[key] = entry
+            if entry[DIGEST] not in self._refs:
+                self.disk_size += entry[SIZE]
+            self._refs[entry[DIGEST]] += 1
+        logger.info(f"Image store loaded: {len(self._index)} images, {self.disk_size} bytes")
+
+    async def save(self):
+        """Persist index if it changed"""
+        if not self._dirty:
+            return
+        self._dirty = False
+        try:
+            await asyncio.to_thread(self._write_index, {key: list(entry) for key, entry in self._index.items()})
+        except Exception as e:
+            self._dirty = True
+            logger.error(f"Failed to save image store index: {e}")
+
+    async def flusher(self, interval: float = IMAGE_STORE_FLUSH_INTERVAL):
+        """Sweep unindexed blobs once, then periodically expire entries and persist index"""
+        try:
+            removed = await asyncio.to_thread(self._sweep, set(self._refs))
+            if removed:
+                logger.info(f"Image store removed {removed} unindexed blobs")
+        except Exception as e:
+            logger.error(f"Image store sweep failed: {e}")
+        while True:
+            await asyncio.sleep(interval)
+            orphans = self._evict()
+            if orphans:
+                await asyncio.to_thread(self._remove_blobs, orphans)
+            await self.save()
+
+    def metrics(self) -> dict:
+        return {
+            "entries": len(self._index),
+            "blobs": len(self._refs),
+            "disk_bytes": self.disk_size,
+            "hot_entries": len(self._hot),
+            "hot_bytes": self.hot_size,
+            **self.stats
+        }
+
+image_store = ImageStore()
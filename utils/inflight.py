@@ -0,0 +1,56 @@
+import asyncio
+from typing import Dict, List, Optional
+from config.settings import COALESCE_MESSAGES
+import logging
+
+logger = logging.getLogger(__name__)
+
+class InFlightTracker:
+    """Keeps at most one running generation per user"""
+
+    def __init__(self, coalesce: bool = COALESCE_MESSAGES):
+        self.coalesce = coalesce
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._pending: Dict[int, List[str]] = {}
+        self.stats = {"started": 0, "superseded": 0}
+
+    def submit(self, user_id: int, text: str) -> str:
+        """Register new message, cancel running generation and return prompt to answer"""
+        task = self._tasks.pop(user_id, None)
+        if task and not task.done():
+            task.cancel()
+            self.stats["superseded"] += 1
+            logger.info(f"Superseded generation for {user_id}")
+
+        if self.coalesce:
+            pending = self._pending.setdefault(user_id, [])
+        else:
+            pending = self._pending[user_id] = []
+        pending.append(text)
+        return "\n".join(pending)
+
+    def commit(self, user_id: int):
+        """Forget queued messages once a reply covering them reached the user"""
+        self._pending.pop(user_id, None)
+
+    async def run(self, user_id: int, coro) -> Optional[object]:
+        """Run coroutine as user's in-flight generation, None if it got superseded"""
+        task = asyncio.ensure_future(coro)
+        self._tasks[user_id] = task
+        self.stats["started"] += 1
+        try:
+            # asyncio.wait does not raise when the inner task is cancelled
+            await asyncio.wait({task})
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        finally:
+            if self._tasks.get(user_id) is task:
+                del self._tasks[user_id]
+                # A failed reply must not leak its texts into every later prompt
+                if task.done() and not task.cancelled() and task.exception() is not None:
+                    self._pending.pop(user_id, None)
+
+        if task.cancelled():
+            return None
+        return task.result()
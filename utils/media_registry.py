@@ -0,0 +1,118 @@
+import asyncio
+import hashlib
+import json
+import os
+from typing import Dict
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import BufferedInputFile, Message
+from config.settings import MEDIA_REGISTRY_PATH, MEDIA_REGISTRY_MAX, MEDIA_REGISTRY_FLUSH_INTERVAL
+from utils.tempfiles import photo_input
+import logging
+
+logger = logging.getLogger(__name__)
+
+class MediaRegistry:
+    """Remembers Telegram file_id per content hash so the same media is uploaded once"""
+
+    def __init__(self, path: str = MEDIA_REGISTRY_PATH, max_entries: int = MEDIA_REGISTRY_MAX):
+        self.path = path
+        self.max_entries = max_entries
+        self._file_ids: Dict[str, str] = {}
+        self._dirty = False
+        self.stats = {"reused": 0, "uploaded": 0, "stale": 0}
+
+    @staticmethod
+    def content_key(kind: str, data: bytes) -> str:
+        return f"{kind}:{hashlib.sha256(data).hexdigest()}"
+
+    def _read(self) -> dict:
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write(self, file_ids: dict):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(file_ids, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+    async def load(self):
+        """Load registry from disk"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            self._file_ids = await asyncio.to_thread(self._read)
+            logger.info(f"Media registry loaded: {len(self._file_ids)} file_ids")
+        except Exception as e:
+            logger.error(f"Failed to load media registry: {e}")
+
+    async def save(self):
+        """Persist registry if it changed"""
+        if not self._dirty:
+            return
+        self._dirty = False
+        try:
+            await asyncio.to_thread(self._write, dict(self._file_ids))
+        except Exception as e:
+            self._dirty = True
+            logger.error(f"Failed to save media registry: {e}")
+
+    async def flusher(self, interval: float = MEDIA_REGISTRY_FLUSH_INTERVAL):
+        """Periodically persist registry"""
+        while True:
+            await asyncio.sleep(interval)
+            await self.save()
+
+    def _remember(self, key: str, file_id: str):
+        self._file_ids.pop(key, None)
+        self._file_ids[key] = file_id
+        while len(self._file_ids) > self.max_entries:
+            self._file_ids.pop(next(iter(self._file_ids)))
+        self._dirty = True
+
+    async def _send(self, kind: str, send, data: bytes, make_input, extract_file_id, **kwargs) -> Message:
+        key = self.content_key(kind, data)
+        file_id = self._file_ids.get(key)
+        if file_id:
+            try:
+                sent = await send(file_id, **kwargs)
+                self.stats["reused"] += 1
+                return sent
+            except TelegramBadRequest as e:
+                # file_id no longer valid (e.g. bot token changed), upload again
+                self.stats["stale"] += 1
+                self._file_ids.pop(key, None)
+                logger.warning(f"Stale {kind} file_id, re-uploading: {e}")
+
+        sent = await send(await make_input(data), **kwargs)
+        self.stats["uploaded"] += 1
+        self._remember(key, extract_file_id(sent))
+        return sent
+
+    async def send_photo(self, bot: Bot, chat_id: int, data: bytes, **kwargs) -> Message:
+        """Send photo by file_id when this content was uploaded before"""
+        return await self._send(
+            "photo",
+            lambda photo, **kw: bot.send_photo(chat_id, photo, **kw),
+            data,
+            photo_input,
+            lambda sent: sent.photo[-1].file_id,
+            **kwargs
+        )
+
+    async def send_voice(self, bot: Bot, chat_id: int, data: bytes, **kwargs) -> Message:
+        """Send voice note by file_id when this content was uploaded before"""
+        async def voice_input(audio: bytes):
+            return BufferedInputFile(audio, filename="voice.ogg")
+
+        return await self._send(
+            "voice",
+            lambda voice, **kw: bot.send_voice(chat_id, voice, **kw),
+            data,
+            voice_input,
+            lambda sent: sent.voice.file_id,
+            **kwargs
+        )
+
+media_registry = MediaRegistry()
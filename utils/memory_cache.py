@@ -0,0 +1,187 @@
+import asyncio
+import heapq
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Optional
+from config.settings import CACHE_SHARDS, CACHE_MAX_ENTRIES, CACHE_MAX_BYTES, CACHE_TTLS, CACHE_SWEEP_INTERVAL
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 3600
+
+def namespace_of(key: str) -> str:
+    """Namespace of key: user:{id}:{namespace}:... or {namespace}:..."""
+    parts = key.split(":", 3)
+    if parts[0] == "user" and len(parts) > 2:
+        return parts[2]
+    return parts[0]
+
+def ttl_for(key: str, ttls: dict = CACHE_TTLS) -> int:
+    """Default TTL for key from its namespace"""
+    return ttls.get(namespace_of(key), DEFAULT_TTL)
+
+class Entry:
+    __slots__ = ("value", "expire", "size")
+
+    def __init__(self, value: Any, expire: float, size: int):
+        self.value = value
+        self.expire = expire
+        self.size = size
+
+class Shard:
+    """LRU dict plus expiry heap; all operations are synchronous, so no lock is needed"""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.data: "OrderedDict[str, Entry]" = OrderedDict()
+        self.heap = []  # (expire, key); stale when entry expire changed
+        self.size = 0
+        self.dirty = False  # changed since last snapshot
+
+    def remove(self, key: str) -> Optional[Entry]:
+        entry = self.data.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+            self.dirty = True
+        return entry
+
+    def schedule(self, key: str, expire: float):
+        heapq.heappush(self.heap, (expire, key))
+        if len(self.heap) > 2 * len(self.data) + 64:
+            # Too many stale timers: rebuild from live entries
+            self.heap = [(entry.expire, k) for k, entry in self.data.items()]
+            heapq.heapify(self.heap)
+
+    def expire(self, now: float) -> int:
+        """Pop due timers; entries whose TTL was extended get their timer pushed back"""
+        removed = 0
+        heap = self.heap
+        while heap and heap[0][0] <= now:
+            _, key = heapq.heappop(heap)
+            entry = self.data.get(key)
+            if entry is None:
+                continue
+            if entry.expire > now:
+                heapq.heappush(heap, (entry.expire, key))
+            else:
+                self.remove(key)
+                removed += 1
+        return removed
+
+    def evict(self) -> int:
+        """Drop least recently used entries until within budget"""
+        evicted = 0
+        while self.data and (len(self.data) > self.max_entries or self.size > self.max_bytes):
+            _, entry = self.data.popitem(last=False)
+            self.size -= entry.size
+            self.dirty = True
+            evicted += 1
+        return evicted
+
+class ShardedMemoryCache:
+    """In-process cache: sharded LRU with expiry heaps, entry/byte budgets and per-namespace TTLs"""
+
+    def __init__(self, shards: int = CACHE_SHARDS, max_entries: int = CACHE_MAX_ENTRIES,
+                 max_bytes: int = CACHE_MAX_BYTES, ttls: dict = None):
+        self._shards = [Shard(max(1, max_entries // shards), max(1, max_bytes // shards)) for _ in range(shards)]
+        self._count = shards
+        self.ttls = CACHE_TTLS if ttls is None else ttls
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+
+    def _shard(self, key: str) -> Shard:
+        # crc32, unlike hash(), puts a key in the same shard after restart (see snapshots)
+        return self._shards[zlib.crc32(key.encode()) % self._count]
+
+    def ttl_for(self, key: str) -> int:
+        return ttl_for(key, self.ttls)
+
+    def get_nowait(self, key: str) -> Any:
+        shard = self._shard(key)
+        entry = shard.data.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        if entry.expire <= time.time():
+            shard.remove(key)
+            self.stats["expired"] += 1
+            self.stats["misses"] += 1
+            return None
+        shard.data.move_to_end(key)
+        self.stats["hits"] += 1
+        return entry.value
+
+    def set_nowait(self, key: str, value: Any, expire: float = None):
+        shard = self._shard(key)
+        now = time.time()
+        deadline = now + (expire if expire is not None else self.ttl_for(key))
+        size = len(value) if isinstance(value, (bytes, str)) else getattr(value, "nbytes", 64)
+        entry = shard.data.get(key)
+        if entry is None:
+            shard.data[key] = Entry(value, deadline, size)
+            shard.schedule(key, deadline)
+        else:
+            # Rewrite in place; the existing timer is pushed back lazily when it fires
+            shard.data.move_to_end(key)
+            if deadline < entry.expire:
+                shard.schedule(key, deadline)
+            shard.size -= entry.size
+            entry.value, entry.expire, entry.size = value, deadline, size
+        shard.size += size
+        shard.dirty = True
+        if shard.heap[0][0] <= now:
+            self.stats["expired"] += shard.expire(now)
+        if shard.size > shard.max_bytes or len(shard.data) > shard.max_entries:
+            self.stats["evictions"] += shard.evict()
+
+    def expire_nowait(self, key: str, seconds: float) -> bool:
+        shard = self._shard(key)
+        entry = shard.data.get(key)
+        if entry is None:
+            return False
+        deadline = time.time() + seconds
+        if deadline < entry.expire:
+            shard.schedule(key, deadline)
+        entry.expire = deadline
+        shard.dirty = True
+        return True
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """Get value from cache"""
+        return self.get_nowait(key)
+
+    async def set(self, key: str, value: bytes, expire: int = None):
+        """Set value in cache, TTL defaults to the key's namespace"""
+        self.set_nowait(key, value, expire)
+
+    async def delete(self, key: str):
+        """Delete key from cache"""
+        self._shard(key).remove(key)
+
+    async def expire(self, key: str, seconds: int):
+        """Set expiration"""
+        self.expire_nowait(key, seconds)
+
+    async def cleanup_expired(self):
+        """Remove expired entries"""
+        now = time.time()
+        for shard in self._shards:
+            self.stats["expired"] += shard.expire(now)
+
+    async def sweeper(self, interval: float = CACHE_SWEEP_INTERVAL):
+        """Periodically expire entries nobody reads anymore"""
+        while True:
+            await asyncio.sleep(interval)
+            await self.cleanup_expired()
+
+    def __len__(self) -> int:
+        return sum(len(shard.data) for shard in self._shards)
+
+    def metrics(self) -> dict:
+        return {
+            "entries": len(self),
+            "bytes": sum(shard.size for shard in self._shards),
+            **self.stats
+        }
@@ -3,15 +3,22 @@ from apscheduler.triggers.cron import CronTrigger
 from aiogram import Bot
 from db.database import Database
 from ai.voice_tts import generate_voice
-from ai.image_gen import generate_image
+from ai.image_gen import generate_image_async
+from utils.cache import Cache
+from utils.characters import load_character
+from utils.media_registry import media_registry
 import logging
 
 logger = logging.getLogger(__name__)
 
+MORNING_GREETING = "Доброе утро, котёнок 😘 Чем займёмся сегодня?"
+EVENING_GREETING = "Спокойной ночи, милый 💋 До завтра!"
+
 class Scheduler:
-    def __init__(self, bot: Bot, db: Database):
+    def __init__(self, bot: Bot, db: Database, cache: Cache = None):
         self.bot = bot
         self.db = db
+        self.cache = cache
         self.scheduler = AsyncIOScheduler()
 
     def start(self):
@@ -36,6 +43,8 @@ class Scheduler:
         """Send morning messages to active users"""
         try:
             active_users = await self.db.get_active_users()
+            # One image per character: every recipient gets the same bytes, so only the first send uploads
+            images = {}
             for user_id in active_users:
                 try:
                     # Get user's current character
@@ -44,17 +53,21 @@ class Scheduler:
 
                     # Generate voice message
                     voice = await generate_voice(
-                        f"Доброе утро, котёнок 😘 Чем займёмся сегодня?",
-                        character
+                        MORNING_GREETING,
+                        load_character(character).get('voice', 'xenia')
                     )
 
                     # Generate image
-                    prompt = f"русская девушка {character} лет в постели утром, реалистично"
-                    image = await generate_image(prompt, character)
+                    if character not in images:
+                        prompt = f"русская девушка {character} лет в постели утром, реалистично"
+                        images[character] = await generate_image_async(prompt, f"{character}_lora", self.cache)
+                    image = images[character]
 
                     # Send messages
-                    await self.bot.send_voice(user_id, voice)
-                    await self.bot.send_photo(user_id, image)
+                    if voice:
+                        await media_registry.send_voice(self.bot, user_id, voice.getvalue())
+                    if image:
+                        await media_registry.send_photo(self.bot, user_id, image)
 
                 except Exception as e:
                     logger.error(f"Failed to send morning message to {user_id}: {e}")
@@ -74,12 +87,13 @@ class Scheduler:
 
                     # Generate voice message
                     voice = await generate_voice(
-                        f"Спокойной ночи, милый 💋 До завтра!",
-                        character
+                        EVENING_GREETING,
+                        load_character(character).get('voice', 'xenia')
                     )
 
                     # Send message
-                    await self.bot.send_voice(user_id, voice)
+                    if voice:
+                        await media_registry.send_voice(self.bot, user_id, voice.getvalue())
 
                 except Exception as e:
                     logger.error(f"Failed to send evening message to {user_id}: {e}")
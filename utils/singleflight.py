@@ -0,0 +1,40 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+import logging
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """Concurrent calls with the same key share one execution and its result"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.stats = {"calls": 0, "shared": 0}
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # retrieved by waiters, or nobody was left to care
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Await fn() unless a call for key is already running, then await that one"""
+        task = self._calls.get(key)
+        if task is None:
+            self.stats["calls"] += 1
+            # Own task: a caller giving up does not cancel the others' result
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.stats["shared"] += 1
+            logger.debug(f"{self.name}: joined in-flight call {key}")
+        return await asyncio.shield(task)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def snapshot(self) -> dict:
+        return {"in_flight": self.in_flight, **self.stats}
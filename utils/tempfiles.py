@@ -0,0 +1,60 @@
+import asyncio
+import os
+import time
+import uuid
+from aiogram.types import BufferedInputFile, FSInputFile, InputFile
+from config.settings import IMAGE_SPILL_BYTES, TEMP_DIR, TEMP_MAX_BYTES, TEMP_FILE_TTL, TEMP_JANITOR_INTERVAL
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _spill(data: bytes, suffix: str) -> str:
+    """Write upload to temp dir"""
+    os.makedirs(TEMP_DIR, exist_ok=True)
+    path = os.path.join(TEMP_DIR, f"photo_{uuid.uuid4()}{suffix}")
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+async def photo_input(data: bytes, filename: str = "photo.jpg") -> InputFile:
+    """Upload image from memory, or from temp/ when it is above IMAGE_SPILL_BYTES"""
+    if IMAGE_SPILL_BYTES and len(data) > IMAGE_SPILL_BYTES:
+        path = await asyncio.to_thread(_spill, data, os.path.splitext(filename)[1])
+        return FSInputFile(path, filename=filename)
+    return BufferedInputFile(data, filename=filename)
+
+def clean_temp_dir(max_bytes: int = TEMP_MAX_BYTES, ttl: float = TEMP_FILE_TTL) -> int:
+    """Delete expired temp files, then oldest ones while over budget; returns files removed"""
+    if not os.path.isdir(TEMP_DIR):
+        return 0
+    now = time.time()
+    files = []
+    for entry in os.scandir(TEMP_DIR):
+        if entry.is_file():
+            stat = entry.stat()
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+    files.sort()
+
+    removed = 0
+    total = sum(size for _, size, _ in files)
+    for mtime, size, path in files:
+        if now - mtime < ttl and total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            removed += 1
+            total -= size
+        except FileNotFoundError:
+            pass
+    return removed
+
+async def temp_janitor(interval: float = TEMP_JANITOR_INTERVAL):
+    """Periodically clean temp dir off the event loop"""
+    while True:
+        try:
+            removed = await asyncio.to_thread(clean_temp_dir)
+            if removed:
+                logger.info(f"Temp janitor removed {removed} files")
+        except Exception as e:
+            logger.error(f"Temp janitor failed: {e}")
+        await asyncio.sleep(interval)